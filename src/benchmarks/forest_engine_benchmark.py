@@ -0,0 +1,68 @@
+"""Compare sklearn predict with the compiled NumPy forest evaluator.
+
+Usage (from src/):
+    python benchmarks/forest_engine_benchmark.py [bundle.joblib]
+
+Without a bundle, a 100-tree forest is trained on synthetic data with the
+CICIoT2023 feature count. Batches are drawn from the bundle's training
+statistics or the synthetic distribution.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from joblib import load
+from sklearn.ensemble import RandomForestClassifier
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'flask_app'))
+from forest_engine import ForestEngine  # noqa: E402
+
+SIZES = [1, 1000, 1000000]
+
+
+def synthetic_model(n_features=46, n_classes=8, rows=50000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(rows, n_features))
+    # Axis-aligned class regions with 2% label noise, so trees grow to realistic depths.
+    y = (4 * (X[:, 0] > 0) + 2 * (X[:, 1] > 0.5) + (X[:, 2] > -0.5)) % n_classes
+    noisy = rng.random(rows) < 0.02
+    y[noisy] = rng.integers(0, n_classes, noisy.sum())
+    model = RandomForestClassifier(n_estimators=100, n_jobs=-1, random_state=seed).fit(X, y)
+    return model, np.zeros(n_features), np.ones(n_features)
+
+
+def timed(fn, X, min_seconds=0.5):
+    # Small batches are repeated until the total is long enough to measure.
+    fn(X)
+    runs, start = 0, time.perf_counter()
+    while True:
+        fn(X)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds or X.shape[0] >= 100000:
+            return elapsed / runs
+
+
+def main(path=None):
+    if path:
+        bundle = load(path)
+        model, mean, scale = bundle['model'], bundle['mean'], bundle['scale']
+    else:
+        model, mean, scale = synthetic_model()
+    engine = ForestEngine.from_model(model, mean, scale)
+    print(f'{len(engine.roots)} trees, {len(engine.feature)} nodes, {len(engine.classes)} classes')
+
+    rng = np.random.default_rng(1)
+    print(f"{'rows':>9} {'sklearn s':>11} {'engine s':>11} {'speedup':>8} {'agree':>7}")
+    for n in SIZES:
+        raw = rng.normal(size=(n, len(mean))) * scale + mean
+        scaled = (raw - mean) / scale
+        t_sklearn = timed(model.predict, scaled)
+        t_engine = timed(engine.predict, raw)
+        agree = (model.predict(scaled) == engine.predict(raw)).mean()
+        print(f'{n:>9} {t_sklearn:>11.5f} {t_engine:>11.5f} {t_sklearn / t_engine:>7.1f}x {agree:>7.4f}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,88 @@
+"""Load-test a running backend: requests/sec for /login and /detect_anomalies.
+
+Usage (from src/):
+    python benchmarks/serving_benchmark.py [http://localhost:5000]
+
+Start the backend first, e.g. `gunicorn` in src/flask_app/ or
+`python backend.py` to compare with the development server. For every
+concurrency level, that many threads send requests back to back, each over
+its own keep-alive connection, for DURATION seconds. Every /detect_anomalies
+request carries slightly different data, so the result cache never answers
+and the numbers measure detection itself.
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+CONCURRENCY = [1, 4, 16, 32]
+DURATION = 10  # seconds per endpoint and concurrency level
+DETECT_ROWS = 1000
+DETECT_COLUMNS = 5
+USER = {'username': 'benchmark', 'password': 'benchmark'}
+DETECT_DATA = {str(c): column.tolist()
+               for c, column in enumerate(np.random.default_rng(0).normal(size=(DETECT_COLUMNS, DETECT_ROWS)))}
+# Request numbers keep counting across runs, so no two detection requests send the same data.
+REQUEST_NUMBERS = itertools.count()
+
+
+def login_request(session, url, i):
+    return session.post(f'{url}/login', json=USER)
+
+
+def detect_request(session, url, i):
+    data = dict(DETECT_DATA, **{'0': [float(i)] + DETECT_DATA['0'][1:]})
+    return session.post(f'{url}/detect_anomalies', json={'data': data, 'algorithm': 'isolation_forest'})
+
+
+def run(url, send, concurrency, duration):
+    """Latencies of the successful requests, the error count and the elapsed seconds.
+
+    `concurrency` threads send requests for `duration` seconds; requests still
+    running then are waited for and counted, and so is their time.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + duration
+
+    def worker():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = send(session, url, next(REQUEST_NUMBERS)).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), errors[0], time.perf_counter() - started
+
+
+def main(url='http://localhost:5000'):
+    requests.post(f'{url}/register', json=USER)  # 409 once the user exists
+    print(f"{'endpoint':>18} {'clients':>8} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for name, send in [('/login', login_request), ('/detect_anomalies', detect_request)]:
+        for concurrency in CONCURRENCY:
+            latencies, errors, elapsed = run(url, send, concurrency, DURATION)
+            p50, p95 = np.percentile(latencies * 1000, [50, 95]) if len(latencies) else (np.nan, np.nan)
+            print(f'{name:>18} {concurrency:>8} {len(latencies):>9} {len(latencies) / elapsed:>8.1f} '
+                  f'{p50:>8.1f} {p95:>8.1f} {errors:>7}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else os.environ.get('DASHBOARD_URL', 'http://localhost:5000'))
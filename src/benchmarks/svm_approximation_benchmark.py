@@ -0,0 +1,58 @@
+"""Compare the exact One-Class SVM with the kernel-approximation mode.
+
+Usage (from src/):
+    python benchmarks/svm_approximation_benchmark.py
+
+For each dataset size both models are fitted on the same standardized
+synthetic data (a Gaussian bulk plus 2% shifted outliers) and scored on
+it. Agreement is the fraction of rows given the same inlier/outlier label
+as the exact model. The exact model is skipped above EXACT_MAX_ROWS.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import OneClassSVM
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'flask_app'))
+from algorithms.svm import ApproximateOneClassSVM  # noqa: E402
+
+SIZES = [1000, 5000, 20000, 50000, 200000, 1000000]
+EXACT_MAX_ROWS = 50000
+N_FEATURES = 10
+
+
+def dataset(n, seed=0):
+    rng = np.random.default_rng(seed)
+    outliers = n // 50
+    X = np.concatenate([rng.normal(size=(n - outliers, N_FEATURES)),
+                        rng.normal(3, 1, size=(outliers, N_FEATURES))])
+    return StandardScaler().fit_transform(X)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    print(f"{'rows':>8} {'mode':>9} {'fit s':>9} {'score s':>9} {'outliers':>9} {'agree':>7}")
+    for n in SIZES:
+        X = dataset(n)
+        exact_pred = None
+        if n <= EXACT_MAX_ROWS:
+            model, fit_time = timed(OneClassSVM(nu=0.1, gamma='auto').fit, X)
+            exact_pred, score_time = timed(model.predict, X)
+            print(f'{n:>8} {"exact":>9} {fit_time:>9.3f} {score_time:>9.3f} {np.mean(exact_pred == -1):>9.3f} {"":>7}')
+        for feature_map in ('nystroem', 'rff'):
+            model, fit_time = timed(ApproximateOneClassSVM(nu=0.1, feature_map=feature_map).fit, X)
+            pred, score_time = timed(model.predict, X)
+            agree = f'{np.mean(pred == exact_pred):.4f}' if exact_pred is not None else '-'
+            print(f'{n:>8} {feature_map:>9} {fit_time:>9.3f} {score_time:>9.3f} {np.mean(pred == -1):>9.3f} {agree:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,280 +1,54 @@
-import pandas as pd
-import numpy as np
-import os
-from tqdm import tqdm
 import warnings
 warnings.filterwarnings('ignore')
 from sklearn.tree import DecisionTreeClassifier
-from joblib import dump
 
-DATASET_DIRECTORY = './dataset/CICIoT2023/'
-"""### Importing Dataset"""
-
-df_sets = [k for k in os.listdir(DATASET_DIRECTORY) if k.endswith('.csv')]
-df_sets.sort()
-training_sets = df_sets[:int(len(df_sets)*.8)]
-test_sets = df_sets[int(len(df_sets)*.8):]
-
-X_columns = [
-    'flow_duration', 'Header_Length', 'Protocol Type', 'Duration',
-       'Rate', 'Srate', 'Drate', 'fin_flag_number', 'syn_flag_number',
-       'rst_flag_number', 'psh_flag_number', 'ack_flag_number',
-       'ece_flag_number', 'cwr_flag_number', 'ack_count',
-       'syn_count', 'fin_count', 'urg_count', 'rst_count',
-    'HTTP', 'HTTPS', 'DNS', 'Telnet', 'SMTP', 'SSH', 'IRC', 'TCP',
-       'UDP', 'DHCP', 'ARP', 'ICMP', 'IPv', 'LLC', 'Tot sum', 'Min',
-       'Max', 'AVG', 'Std', 'Tot size', 'IAT', 'Number', 'Magnitue',
-       'Radius', 'Covariance', 'Variance', 'Weight',
-]
-y_column = 'label'
-
-"""### Scaling"""
-
-from sklearn.preprocessing import MinMaxScaler, StandardScaler
-scaler = StandardScaler()
-
-for train_set in tqdm(training_sets):
-    scaler.fit(pd.read_csv(DATASET_DIRECTORY + train_set)[X_columns])
-
-"""### Classification: 34 (33+1) classes"""
-
-ML_models = [
-        DecisionTreeClassifier(),
-]
-
-ML_neams = [
-        "DecisionTreeClassifier",
-]
-
-for train_set in tqdm(training_sets):
-    d = pd.read_csv(DATASET_DIRECTORY + train_set)
-    d[X_columns] = scaler.transform(d[X_columns])
-    for model in (ML_models):
-        model.fit(d[X_columns], d[y_column])
-    del d
-
-y_test = []
-preds = {i:[] for i in range(len(ML_models))}
-for test_set in tqdm(test_sets):
-    d_test = pd.read_csv(DATASET_DIRECTORY + test_set)
-    d_test[X_columns] = scaler.transform(d_test[X_columns])
-
-    y_test += list(d_test[y_column].values)
-
-    for i in range(len(ML_models)):
-        model = ML_models[i]
-        y_pred = list(model.predict(d_test[X_columns]))
-        preds[i] = preds[i] + y_pred
-
-from sklearn.metrics import accuracy_score, recall_score, precision_score, f1_score
-for k,v in preds.items():
-    y_pred = v
-    print(f"##### {ML_neams[k]} (34 classes) #####")
-    print('accuracy_score: ', accuracy_score(y_pred, y_test))
-    print('recall_score: ', recall_score(y_pred, y_test, average='macro'))
-    print('precision_score: ', precision_score(y_pred, y_test, average='macro'))
-    print('f1_score: ', f1_score(y_pred, y_test, average='macro'))
-    print()
-    print()
-    print()
-
-"""# Classification: 8 (7+1) classes"""
-
-dict_7classes = {
-    # Define mappings for 7 classes here
-}
-dict_7classes['DDoS-RSTFINFlood'] = 'DDoS'
-dict_7classes['DDoS-PSHACK_Flood'] = 'DDoS'
-dict_7classes['DDoS-SYN_Flood'] = 'DDoS'
-dict_7classes['DDoS-UDP_Flood'] = 'DDoS'
-dict_7classes['DDoS-TCP_Flood'] = 'DDoS'
-dict_7classes['DDoS-ICMP_Flood'] = 'DDoS'
-dict_7classes['DDoS-SynonymousIP_Flood'] = 'DDoS'
-dict_7classes['DDoS-ACK_Fragmentation'] = 'DDoS'
-dict_7classes['DDoS-UDP_Fragmentation'] = 'DDoS'
-dict_7classes['DDoS-ICMP_Fragmentation'] = 'DDoS'
-dict_7classes['DDoS-SlowLoris'] = 'DDoS'
-dict_7classes['DDoS-HTTP_Flood'] = 'DDoS'
-
-dict_7classes['DoS-UDP_Flood'] = 'DoS'
-dict_7classes['DoS-SYN_Flood'] = 'DoS'
-dict_7classes['DoS-TCP_Flood'] = 'DoS'
-dict_7classes['DoS-HTTP_Flood'] = 'DoS'
-
-
-dict_7classes['Mirai-greeth_flood'] = 'Mirai'
-dict_7classes['Mirai-greip_flood'] = 'Mirai'
-dict_7classes['Mirai-udpplain'] = 'Mirai'
-
-dict_7classes['Recon-PingSweep'] = 'Recon'
-dict_7classes['Recon-OSScan'] = 'Recon'
-dict_7classes['Recon-PortScan'] = 'Recon'
-dict_7classes['VulnerabilityScan'] = 'Recon'
-dict_7classes['Recon-HostDiscovery'] = 'Recon'
-
-dict_7classes['DNS_Spoofing'] = 'Spoofing'
-dict_7classes['MITM-ArpSpoofing'] = 'Spoofing'
-
-dict_7classes['BenignTraffic'] = 'Benign'
+from training import (load_datasets, prepare_dataset, fit_scaler, load_training_set, label_lookup, evaluate,
+                      export_bundle, LABELS_8_CLASSES, LABELS_2_CLASSES)
 
-dict_7classes['BrowserHijacking'] = 'Web'
-dict_7classes['Backdoor_Malware'] = 'Web'
-dict_7classes['XSS'] = 'Web'
-dict_7classes['Uploading_Attack'] = 'Web'
-dict_7classes['SqlInjection'] = 'Web'
-dict_7classes['CommandInjection'] = 'Web'
-
-
-dict_7classes['DictionaryBruteForce'] = 'BruteForce'
-
-ML_models = [
-        DecisionTreeClassifier(),
-]
-
-ML_neams = [
-        "DecisionTreeClassifier",
-]
-
-
-for train_set in tqdm(training_sets):
-    d = pd.read_csv(DATASET_DIRECTORY + train_set)
-    d[X_columns] = scaler.transform(d[X_columns])
-    new_y = [dict_7classes[k] for k in d[y_column]]
-    d[y_column] = new_y
-
-    for model in (ML_models):
-        model.fit(d[X_columns], d[y_column])
-    del d
-
-y_test = []
-preds = {i:[] for i in range(len(ML_models))}
-for test_set in tqdm(test_sets):
-    d_test = pd.read_csv(DATASET_DIRECTORY + test_set)
-    d_test[X_columns] = scaler.transform(d_test[X_columns])
-    new_y = [dict_7classes[k] for k in d_test[y_column]]
-    d_test[y_column] = new_y
-
-    y_test += list(d_test[y_column].values)
-
-    for i in range(len(ML_models)):
-        model = ML_models[i]
-        y_pred = list(model.predict(d_test[X_columns]))
-        preds[i] = preds[i] + y_pred
-
-for k,v in preds.items():
-    y_pred = v
-    print(f"##### {ML_neams[k]} (8 classes) #####")
-    print('accuracy_score = ', accuracy_score(y_pred, y_test))
-    print('recall_score = ', recall_score(y_pred, y_test, average='macro'))
-    print('precision_score = ', precision_score(y_pred, y_test, average='macro'))
-    print('f1_score = ', f1_score(y_pred, y_test, average='macro'))
-    print()
-    print()
-    print()
-
-"""# Classification: 2 (1+1) Classes"""
-
-dict_2classes = {
-    # Define mappings for 2 classes here
-}
-dict_2classes['DDoS-RSTFINFlood'] = 'Attack'
-dict_2classes['DDoS-PSHACK_Flood'] = 'Attack'
-dict_2classes['DDoS-SYN_Flood'] = 'Attack'
-dict_2classes['DDoS-UDP_Flood'] = 'Attack'
-dict_2classes['DDoS-TCP_Flood'] = 'Attack'
-dict_2classes['DDoS-ICMP_Flood'] = 'Attack'
-dict_2classes['DDoS-SynonymousIP_Flood'] = 'Attack'
-dict_2classes['DDoS-ACK_Fragmentation'] = 'Attack'
-dict_2classes['DDoS-UDP_Fragmentation'] = 'Attack'
-dict_2classes['DDoS-ICMP_Fragmentation'] = 'Attack'
-dict_2classes['DDoS-SlowLoris'] = 'Attack'
-dict_2classes['DDoS-HTTP_Flood'] = 'Attack'
-
-dict_2classes['DoS-UDP_Flood'] = 'Attack'
-dict_2classes['DoS-SYN_Flood'] = 'Attack'
-dict_2classes['DoS-TCP_Flood'] = 'Attack'
-dict_2classes['DoS-HTTP_Flood'] = 'Attack'
-
-
-dict_2classes['Mirai-greeth_flood'] = 'Attack'
-dict_2classes['Mirai-greip_flood'] = 'Attack'
-dict_2classes['Mirai-udpplain'] = 'Attack'
-
-dict_2classes['Recon-PingSweep'] = 'Attack'
-dict_2classes['Recon-OSScan'] = 'Attack'
-dict_2classes['Recon-PortScan'] = 'Attack'
-dict_2classes['VulnerabilityScan'] = 'Attack'
-dict_2classes['Recon-HostDiscovery'] = 'Attack'
-
-dict_2classes['DNS_Spoofing'] = 'Attack'
-dict_2classes['MITM-ArpSpoofing'] = 'Attack'
-
-dict_2classes['BenignTraffic'] = 'Benign'
-
-dict_2classes['BrowserHijacking'] = 'Attack'
-dict_2classes['Backdoor_Malware'] = 'Attack'
-dict_2classes['XSS'] = 'Attack'
-dict_2classes['Uploading_Attack'] = 'Attack'
-dict_2classes['SqlInjection'] = 'Attack'
-dict_2classes['CommandInjection'] = 'Attack'
-
-dict_2classes['DictionaryBruteForce'] = 'Attack'
+DATASET_DIRECTORY = './dataset/CICIoT2023/'
+CACHE_DIRECTORY = './dataset/CICIoT2023_cache/'
 
-ML_models = [
-        DecisionTreeClassifier(),
-]
 
-ML_neams = [
-        "DecisionTreeClassifier",
-]
+# The main guard keeps worker processes that parse shards from re-running the script.
+if __name__ == "__main__":
+    """### Importing Dataset"""
 
+    training_sets, test_sets = load_datasets(DATASET_DIRECTORY)
+    # Parse each CSV once into a memory-mappable cache; every later pass reads the cache.
+    training_sets = prepare_dataset(training_sets, CACHE_DIRECTORY)
+    test_sets = prepare_dataset(test_sets, CACHE_DIRECTORY)
 
-for train_set in tqdm(training_sets):
-    d = pd.read_csv(DATASET_DIRECTORY + train_set)
-    d[X_columns] = scaler.transform(d[X_columns])
-    new_y = [dict_2classes[k] for k in d[y_column]]
-    d[y_column] = new_y
+    """### Scaling"""
 
-    for model in (ML_models):
-        model.fit(d[X_columns], d[y_column])
-    del d
+    # One streaming partial_fit pass over all training shards.
+    scaler, _ = fit_scaler(training_sets)
 
-y_test = []
-preds = {i:[] for i in range(len(ML_models))}
-for test_set in tqdm(test_sets):
-    d_test = pd.read_csv(DATASET_DIRECTORY + test_set)
-    d_test[X_columns] = scaler.transform(d_test[X_columns])
-    new_y = [dict_2classes[k] for k in d_test[y_column]]
-    d_test[y_column] = new_y
+    """### Classification: 34 (33+1), 8 (7+1) and 2 (1+1) classes"""
 
-    y_test += list(d_test[y_column].values)
+    targets = {
+        "DecisionTreeClassifier (34 classes)": None,
+        "DecisionTreeClassifier (8 classes)": LABELS_8_CLASSES,
+        "DecisionTreeClassifier (2 classes)": LABELS_2_CLASSES,
+    }
 
-    for i in range(len(ML_models)):
-        model = ML_models[i]
-        y_pred = list(model.predict(d_test[X_columns]))
-        preds[i] = preds[i] + y_pred
+    # A decision tree cannot be grown incrementally, so each one is fitted once on
+    # the full training set, which is loaded a single time for all three targets.
+    X_train, codes_train = load_training_set(training_sets, scaler)
+    ML_models = {}
+    for name, mapping in targets.items():
+        ML_models[name] = DecisionTreeClassifier().fit(X_train, label_lookup(mapping)[codes_train])
+    del X_train, codes_train
 
-for k,v in preds.items():
-    y_pred = v
-    print(f"##### {ML_neams[k]} (2 classes) #####")
-    print('accuracy_score: ', accuracy_score(y_pred, y_test))
-    print('recall_score: ', recall_score(y_pred, y_test, average='macro'))
-    print('precision_score: ', precision_score(y_pred, y_test, average='macro'))
-    print('f1_score: ', f1_score(y_pred, y_test, average='macro'))
-    print()
-    print()
-    print()
+    evaluate(ML_models, test_sets, scaler, targets)
 
-model_34_classes = ML_models[0]  # For the 34-class scenario
-model_8_classes = ML_models[0]   # For the 8-class scenario
-model_2_classes = ML_models[0]   # For the 2-class scenario
+    model_34_classes, model_8_classes, model_2_classes = ML_models.values()
 
-# Define file paths where you want to save the models
-model_34_classes_file_path = "decision_tree_model_34_classes.joblib"
-model_8_classes_file_path = "decision_tree_model_8_classes.joblib"
-model_2_classes_file_path = "decision_tree_model_2_classes.joblib"
+    # Define file paths where you want to save the models
+    model_34_classes_file_path = "decision_tree_model_34_classes.joblib"
+    model_8_classes_file_path = "decision_tree_model_8_classes.joblib"
+    model_2_classes_file_path = "decision_tree_model_2_classes.joblib"
 
-# Export the models
-dump(model_34_classes, model_34_classes_file_path)
-dump(model_8_classes, model_8_classes_file_path)
-dump(model_2_classes, model_2_classes_file_path)
+    # Export the models with the fitted scaler and feature order
+    export_bundle(model_34_classes, scaler, model_34_classes_file_path)
+    export_bundle(model_8_classes, scaler, model_8_classes_file_path)
+    export_bundle(model_2_classes, scaler, model_2_classes_file_path)
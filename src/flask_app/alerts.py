@@ -0,0 +1,301 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from collections import deque
+
+import numpy as np
+
+# Rules see batches of anomaly scores (negative is anomalous) from one source,
+# e.g. an MQTT topic/device or an uploaded dataset, and return the positions
+# at which they fire. Their per-source state lives in a dict owned by the engine.
+
+
+class ThresholdRule:
+    """Fires on every score below `threshold`."""
+
+    def __init__(self, threshold=0.0, name='threshold'):
+        self.threshold = threshold
+        self.name = name
+
+    def fire(self, state, scores, times):
+        return np.flatnonzero(scores < self.threshold)
+
+
+class ConsecutiveRule:
+    """Fires when `count` scores in a row are below `threshold`, once per run."""
+
+    def __init__(self, count=5, threshold=0.0, name='consecutive'):
+        self.count = count
+        self.threshold = threshold
+        self.name = name
+
+    def fire(self, state, scores, times):
+        below = scores < self.threshold
+        pos = np.arange(len(scores))
+        # Length of the run of low scores ending at each position, carrying the run from the last batch.
+        last_high = np.maximum.accumulate(np.where(below, -1, pos))
+        run = np.where(last_high < 0, pos + 1 + state.get('run', 0), pos - last_high)
+        run[~below] = 0
+        if len(run):
+            state['run'] = int(run[-1])
+        return np.flatnonzero(run == self.count)
+
+
+class RateRule:
+    """Fires while at least `count` scores below `threshold` fall within `window` seconds."""
+
+    def __init__(self, count=20, window=60.0, threshold=0.0, name='rate'):
+        self.count = count
+        self.window = window
+        self.threshold = threshold
+        self.name = name
+
+    def fire(self, state, scores, times):
+        low = np.flatnonzero(scores < self.threshold)
+        recent = state.get('times', np.empty(0))
+        all_times = np.concatenate([recent, times[low]])
+        if not len(all_times):
+            return low
+        starts = np.searchsorted(all_times, all_times - self.window, side='right')
+        counts = np.arange(len(all_times)) - starts + 1
+        state['times'] = all_times[all_times > all_times[-1] - self.window][-self.count:]
+        return low[counts[len(recent):] >= self.count]
+
+
+RULES = {'threshold': ThresholdRule, 'consecutive': ConsecutiveRule, 'rate': RateRule}
+
+
+def make_rule(spec):
+    """Build a rule from a config dict such as {'type': 'rate', 'count': 20, 'window': 60}."""
+    spec = dict(spec)
+    kind = spec.pop('type')
+    if kind not in RULES:
+        raise ValueError(f'Unknown alert rule: {kind}')
+    return RULES[kind](**spec)
+
+
+class FileSink:
+    """Appends every alert as one JSON line."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def send(self, alert):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(alert) + '\n')
+
+
+class WebhookSink:
+    """POSTs every alert as JSON to `url`."""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alert):
+        body = json.dumps(alert).encode('utf-8')
+        req = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            response.read()
+
+
+class AlertEngine:
+    """Turns anomaly scores into deduplicated, rate-limited alerts, off the scoring path.
+
+    `submit` only enqueues; a worker thread evaluates the rules and a second
+    thread hands alerts to the sinks, so a slow webhook or a flood of
+    anomalies never blocks detection. When the queue is full new batches are
+    dropped and counted. A rule firing again for the same source within
+    `dedup_window` seconds is coalesced into the open alert (its count grows);
+    once quiet for that long the alert resolves, and the sinks get one
+    summary if it coalesced anything. At most `rate_limit` new alerts per
+    `rate_period` seconds are sent per (user, source); the rest are kept in
+    the history as suppressed. Rule state and rate-limit history are kept per
+    (user, source) and forgotten once it has submitted nothing for
+    `state_ttl` seconds.
+    """
+
+    def __init__(self, rules, sinks=(), dedup_window=60.0, rate_limit=10, rate_period=60.0,
+                 queue_size=10000, history_size=1000, state_ttl=3600.0):
+        self.rules = list(rules)
+        self.sinks = list(sinks)
+        self.dedup_window = dedup_window
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.outbox = queue.Queue(maxsize=queue_size)
+        self.history = deque(maxlen=history_size)
+        self.state_ttl = max(state_ttl, dedup_window, rate_period)
+        self.open = {}  # (rule, user, source) -> alert
+        self.state = {}  # (rule, user, source) -> rule state
+        self.sent = {}  # (user, source) -> times of recently sent alerts
+        self.active = {}  # (user, source) -> time of its last submission
+        self.pruned_at = time.time()
+        self.lock = threading.Lock()
+        self.counters = {'submitted': 0, 'dropped': 0, 'alerts': 0, 'coalesced': 0, 'suppressed': 0,
+                         'sent': 0, 'sink_errors': 0}
+        self.threads = []
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            self.threads = [threading.Thread(target=self._evaluate_loop, daemon=True),
+                            threading.Thread(target=self._dispatch_loop, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, source, scores, times=None, user=None, reset=False):
+        """Queue scores from `source` for rule evaluation; returns False if the queue is full.
+
+        `times` are epoch seconds, one per score; without them the scores are
+        taken to arrive now. `reset` starts the rules afresh instead of
+        continuing from the source's previous batch, e.g. for a new upload.
+        """
+        if not self.threads:
+            self.start()
+        try:
+            self.inbox.put_nowait((source, user, scores, times, time.time(), reset))
+        except queue.Full:
+            with self.lock:
+                self.counters['dropped'] += 1
+            return False
+        with self.lock:
+            self.counters['submitted'] += 1
+        return True
+
+    def _evaluate_loop(self):
+        while True:
+            try:
+                item = self.inbox.get(timeout=1.0)
+            except queue.Empty:
+                item = None
+            try:
+                if item is not None:
+                    self._evaluate(*item)
+                now = time.time()
+                self._resolve_quiet(now)
+                if now - self.pruned_at > min(self.state_ttl, 60.0):
+                    self._prune(now)
+            except Exception as e:
+                logging.error(f'Alert evaluation failed: {str(e)}')
+            finally:
+                if item is not None:
+                    self.inbox.task_done()
+
+    def _evaluate(self, source, user, scores, times, received, reset=False):
+        # None scores (warm-up) never fire.
+        scores = np.asarray([np.nan if s is None else s for s in scores], dtype=np.float64) \
+            if isinstance(scores, list) else np.asarray(scores, dtype=np.float64)
+        times = np.full(len(scores), received) if times is None else np.asarray(times, dtype=np.float64)
+        self.active[(user, source)] = received
+        for rule in self.rules:
+            if reset:
+                self.state.pop((rule.name, user, source), None)
+            state = self.state.setdefault((rule.name, user, source), {})
+            fired = rule.fire(state, scores, times)
+            if len(fired):
+                self._raise(rule.name, source, user, scores[fired], times[fired])
+
+    def _raise(self, rule, source, user, scores, times):
+        key = (rule, user, source)
+        now = float(times[-1])
+        with self.lock:
+            alert = self.open.get(key)
+            if alert is not None and now - alert['last_seen'] <= self.dedup_window:
+                alert['count'] += len(scores)
+                alert['last_seen'] = now
+                alert['score'] = min(alert['score'], float(np.min(scores)))
+                self.counters['coalesced'] += len(scores)
+                return
+            alert = {'id': uuid.uuid4().hex, 'rule': rule, 'source': source, 'user': user, 'status': 'open',
+                     'first_seen': float(times[0]), 'last_seen': now, 'count': len(scores),
+                     'score': float(np.min(scores)), 'suppressed': not self._allow(user, source, now)}
+            self.open[key] = alert
+            self.history.append(alert)
+            self.counters['alerts'] += 1
+            self.counters['suppressed' if alert['suppressed'] else 'sent'] += 1
+        if not alert['suppressed']:
+            self._send(dict(alert))
+
+    def _allow(self, user, source, now):
+        sent = self.sent.setdefault((user, source), deque())
+        while sent and sent[0] <= now - self.rate_period:
+            sent.popleft()
+        if len(sent) >= self.rate_limit:
+            return False
+        sent.append(now)
+        return True
+
+    def _resolve_quiet(self, now):
+        with self.lock:
+            quiet = [key for key, alert in self.open.items() if now - alert['last_seen'] > self.dedup_window]
+            resolved = [self.open.pop(key) for key in quiet]
+            for alert in resolved:
+                alert['status'] = 'resolved'
+        for alert in resolved:
+            if alert['count'] > 1 and not alert['suppressed']:
+                self._send(dict(alert))
+
+    def _prune(self, now):
+        """Forget the rule state and rate-limit history of sources idle for `state_ttl` seconds."""
+        self.pruned_at = now
+        with self.lock:
+            idle = [key for key, last in self.active.items() if now - last > self.state_ttl
+                    and not any((rule.name,) + key in self.open for rule in self.rules)]
+            for key in idle:
+                del self.active[key]
+                self.sent.pop(key, None)
+                for rule in self.rules:
+                    self.state.pop((rule.name,) + key, None)
+
+    def _send(self, alert):
+        try:
+            self.outbox.put_nowait(alert)
+        except queue.Full:
+            with self.lock:
+                self.counters['dropped'] += 1
+
+    def _dispatch_loop(self):
+        while True:
+            alert = self.outbox.get()
+            for sink in self.sinks:
+                try:
+                    sink.send(alert)
+                except Exception as e:
+                    logging.error(f'Alert sink {type(sink).__name__} failed: {str(e)}')
+                    with self.lock:
+                        self.counters['sink_errors'] += 1
+            self.outbox.task_done()
+
+    def flush(self, timeout=10.0):
+        """Wait up to `timeout` seconds for queued scores and alerts to reach the sinks; returns True if they did."""
+        deadline = time.monotonic() + timeout
+        while self.threads and (self.inbox.unfinished_tasks or self.outbox.unfinished_tasks):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def alerts(self, user=None, source=None, status=None, limit=100):
+        with self.lock:
+            found = [dict(alert) for alert in reversed(self.history)
+                     if (user is None or alert['user'] == user)
+                     and (source is None or alert['source'] == source)
+                     and (status is None or alert['status'] == status)]
+        return found[:limit]
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, queued=self.inbox.qsize(), open=len(self.open), sources=len(self.active))
@@ -1,8 +1,149 @@
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from sklearn.metrics import silhouette_score, calinski_harabasz_score, davies_bouldin_score
 from sklearn.cluster import DBSCAN
+from sklearn.neighbors import BallTree, KDTree, NearestNeighbors, VALID_METRICS
 from sklearn.preprocessing import MinMaxScaler
+import numpy as np
 import pandas as pd
-def detect_anomalies_dbscan(df, eps=0.2, min_samples=5, metric="euclidean", evaluate=False):
+
+# Above this many rows the indexed implementation is used and evaluation metrics are sampled.
+LARGE_DBSCAN_ROWS = 50000
+EVALUATION_SAMPLE = 10000
+
+
+class IndexedDBSCAN:
+    """DBSCAN with an explicit KD-tree/ball-tree and chunked radius queries.
+
+    sklearn's DBSCAN materializes every point's neighbourhood at once, which
+    grows with n times the average neighbourhood size. Here neighbour counts
+    are taken first (count_only queries, no index lists), then the core
+    points' neighbourhoods are queried in chunks holding at most
+    `max_neighbors` indices and merged into clusters with a connected
+    components pass per chunk. Border points join the cluster of their
+    nearest core point within eps. Noise points are the same as sklearn's;
+    a border point reachable from two clusters may be given the other one.
+    Exposes labels_, core_sample_indices_ and components_ like sklearn.
+    """
+
+    def __init__(self, eps=0.5, min_samples=5, metric='euclidean', leaf_size=40, max_neighbors=2000000):
+        self.eps = eps
+        self.min_samples = min_samples
+        self.metric = metric
+        self.leaf_size = leaf_size
+        self.max_neighbors = max_neighbors
+
+    def _tree(self, X):
+        tree_cls = KDTree if self.metric in VALID_METRICS['kd_tree'] else BallTree
+        return tree_cls(X, leaf_size=self.leaf_size, metric=self.metric)
+
+    def fit(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        n = len(X)
+        tree = self._tree(X)
+        counts = np.concatenate([tree.query_radius(X[start:start + 10000], self.eps, count_only=True)
+                                 for start in range(0, n, 10000)])
+        core = np.flatnonzero(counts >= self.min_samples)
+        position = np.full(n, -1)
+        position[core] = np.arange(len(core))
+
+        # Component id of every core point, merged chunk by chunk.
+        component = np.arange(len(core))
+        bounds = np.cumsum(counts[core])
+        start = 0
+        while start < len(core):
+            budget = (bounds[start - 1] if start else 0) + self.max_neighbors
+            stop = max(start + 1, int(np.searchsorted(bounds, budget, side='right')))
+            neighbors = tree.query_radius(X[core[start:stop]], self.eps)
+            src = np.repeat(np.arange(start, stop), [len(ind) for ind in neighbors])
+            dst = position[np.concatenate(neighbors)]
+            linked = dst >= 0
+            src, dst = component[src[linked]], component[dst[linked]]
+            graph = coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(len(core), len(core)))
+            component = connected_components(graph, directed=False)[1][component]
+            start = stop
+
+        # Number clusters in order of first appearance, as sklearn does.
+        _, first, inverse = np.unique(component, return_index=True, return_inverse=True)
+        cluster = np.argsort(np.argsort(first))[inverse]
+
+        labels = np.full(n, -1)
+        labels[core] = cluster
+        border = np.flatnonzero(counts < self.min_samples)
+        if len(core) and len(border):
+            core_tree = self._tree(X[core])
+            for start in range(0, len(border), 10000):
+                rows = border[start:start + 10000]
+                distances, nearest = core_tree.query(X[rows], k=1)
+                within = distances[:, 0] <= self.eps
+                labels[rows[within]] = cluster[nearest[within, 0]]
+
+        self.labels_ = labels
+        self.core_sample_indices_ = core
+        self.components_ = X[core]
+        return self
+
+    def fit_predict(self, X):
+        return self.fit(X).labels_
+
+
+def make_dbscan(n_rows, eps, min_samples, metric, large=None):
+    """sklearn's DBSCAN for small inputs, IndexedDBSCAN above LARGE_DBSCAN_ROWS (or when `large` is set)."""
+    if large is None:
+        large = n_rows > LARGE_DBSCAN_ROWS
+    if large:
+        return IndexedDBSCAN(eps=eps, min_samples=min_samples, metric=metric)
+    return DBSCAN(eps=eps, min_samples=min_samples, metric=metric)
+
+
+def evaluation_metrics(X, clusters, sample_size=EVALUATION_SAMPLE):
+    """Clustering quality scores. The silhouette is O(n^2), so it is estimated on a sample for large inputs."""
+    sample = sample_size if len(X) > sample_size else None
+    return {
+        "Silhouette Score": silhouette_score(X, clusters, sample_size=sample, random_state=0),
+        "Calinski-Harabasz Score": calinski_harabasz_score(X, clusters),
+        "Davies-Bouldin Score": davies_bouldin_score(X, clusters)
+    }
+
+
+class DBSCANModel:
+    """Fitted DBSCAN plus an index over its core samples so new points can be labelled."""
+
+    def __init__(self, dbscan):
+        self.dbscan = dbscan
+        self.labels_ = dbscan.labels_
+        self.core_labels = dbscan.labels_[dbscan.core_sample_indices_]
+        self.core_index = None
+        if len(dbscan.core_sample_indices_) > 0:
+            self.core_index = NearestNeighbors(n_neighbors=1, metric=dbscan.metric).fit(dbscan.components_)
+
+    def predict(self, X):
+        # A point joins the cluster of its nearest core sample if it lies within eps, otherwise it is noise.
+        labels = np.full(len(X), -1, dtype=int)
+        if self.core_index is None or len(X) == 0:
+            return labels
+        distances, indices = self.core_index.kneighbors(X)
+        within = distances[:, 0] <= self.dbscan.eps
+        labels[within] = self.core_labels[indices[within, 0]]
+        return labels
+
+
+def fit_dbscan(df, eps=0.2, min_samples=5, metric="euclidean", large=None):
+    # Preprocess data
+    scaler = MinMaxScaler()
+    X = scaler.fit_transform(df.values)
+
+    # Fit DBSCAN with user-provided parameters
+    outlier_detection = make_dbscan(len(X), eps, min_samples, metric, large)
+    outlier_detection.fit(X)
+    return scaler, DBSCANModel(outlier_detection)
+
+def score_dbscan(scaler, model, df):
+    return model.predict(scaler.transform(df.values))
+
+def detect_anomalies_dbscan(df, eps=0.2, min_samples=5, metric="euclidean", evaluate=False, noise_only=False,
+                            large=None):
+    """Cluster labels per row (-1 for noise), or only the row positions of noise points with `noise_only`."""
 
     try:
         # Ensure data is numerical
@@ -14,7 +155,7 @@ def detect_anomalies_dbscan(df, eps=0.2, min_samples=5, metric="euclidean", eval
         X = scaler.fit_transform(df.values)
 
         # Fit DBSCAN with user-provided parameters
-        outlier_detection = DBSCAN(eps=eps, min_samples=min_samples, metric=metric)
+        outlier_detection = make_dbscan(len(X), eps, min_samples, metric, large)
         clusters = outlier_detection.fit_predict(X)
 
         # Mark outliers (noise) as -1
@@ -23,13 +164,10 @@ def detect_anomalies_dbscan(df, eps=0.2, min_samples=5, metric="euclidean", eval
         # Optionally evaluate the DBSCAN model
         if evaluate:
             if len(set(clusters)) > 1:
-                evaluation_metrics = {
-                    "Silhouette Score": silhouette_score(X, clusters),
-                    "Calinski-Harabasz Score": calinski_harabasz_score(X, clusters),
-                    "Davies-Bouldin Score": davies_bouldin_score(X, clusters)
-                }
-                print(evaluation_metrics)  # Print in a more organized format
+                print(evaluation_metrics(X, clusters))  # Print in a more organized format
 
+        if noise_only:
+            return np.flatnonzero(clusters == -1).tolist()
         return clusters.tolist()
 
     except Exception as e:
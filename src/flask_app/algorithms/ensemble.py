@@ -0,0 +1,101 @@
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+from sklearn.preprocessing import StandardScaler
+
+from algorithms.dbscan import make_dbscan
+from algorithms.isolation_forest import FIT_ROWS, fit_iforest, score_iforest
+from algorithms.svm import make_svm
+
+
+# Each scorer takes the shared standardized matrix and returns one score per row, negative for anomalies.
+
+def iforest_scores(X, contamination=0.1, n_estimators=100, max_samples='auto', random_state=42, n_jobs=-1,
+                   fit_rows=FIT_ROWS):
+    # Same fit and chunked scoring as the single-algorithm route; re-standardizing X changes nothing for the trees.
+    df = pd.DataFrame(X)
+    scaler, clf = fit_iforest(df, contamination=contamination, n_estimators=n_estimators, max_samples=max_samples,
+                              random_state=random_state, n_jobs=n_jobs, fit_rows=fit_rows)
+    return score_iforest(scaler, clf, df, n_jobs=n_jobs)
+
+def svm_scores(X, nu=0.1, kernel="rbf", gamma="auto", approximate=None, n_components=300, feature_map='nystroem'):
+    return make_svm(len(X), nu, kernel, gamma, approximate, n_components, feature_map).fit(X).decision_function(X)
+
+def dbscan_scores(X, eps=0.2, min_samples=5, metric="euclidean", large=None):
+    # Min-max scaling the standardized matrix gives the same result as scaling the raw data.
+    low, span = X.min(axis=0), np.ptp(X, axis=0)
+    span[span == 0] = 1.0
+    labels = make_dbscan(len(X), eps, min_samples, metric, large).fit_predict((X - low) / span)
+    return np.where(labels == -1, -1.0, 1.0)
+
+SCORERS = {
+    'isolation_forest': iforest_scores,
+    'SVM': svm_scores,
+    'DBSCAN': dbscan_scores,
+}
+
+
+def rank_normalize(scores):
+    """Map scores (negative = anomalous) to [0, 1] by rank, 1 for the most anomalous row. Ties share their mean rank."""
+    if len(scores) < 2:
+        return np.zeros(len(scores))
+    return (rankdata(-np.asarray(scores), method='average') - 1) / (len(scores) - 1)
+
+
+def check_parameters(algorithms, parameters):
+    """Raise ValueError or TypeError unless `parameters` maps algorithms to keyword arguments their scorers accept."""
+    if not isinstance(parameters, dict):
+        raise TypeError('parameters must map algorithm names to parameter objects.')
+    unknown = [a for a in parameters if a not in SCORERS]
+    if unknown:
+        raise ValueError(f"Parameters given for unknown algorithms: {unknown}")
+    for algorithm in algorithms:
+        given = parameters.get(algorithm, {})
+        if not isinstance(given, dict):
+            raise TypeError(f'Parameters of {algorithm} must be an object.')
+        try:
+            inspect.signature(SCORERS[algorithm]).bind(None, **given)
+        except TypeError as e:
+            raise TypeError(f'Invalid parameters for {algorithm}: {str(e)}')
+
+
+def detect_anomalies_ensemble(df, algorithms=None, parameters=None, max_workers=None):
+    """Run several detectors on one standardized copy of `df`, concurrently.
+
+    Returns the raw scores of every algorithm and `combined`, the mean of
+    their rank-normalized scores: in [0, 1], higher is more anomalous, so
+    detectors with different score scales weigh equally. Invalid input or
+    parameters raise ValueError or TypeError; other failures return None.
+    """
+    # Ensure data is numerical
+    if not pd.api.types.is_numeric_dtype(df.dtypes.all()):
+        raise ValueError("Data must contain only numerical values.")
+    algorithms = list(algorithms or SCORERS)
+    unknown = [a for a in algorithms if a not in SCORERS]
+    if unknown:
+        raise ValueError(f"Unknown algorithms: {unknown}")
+    parameters = parameters or {}
+    # Checked before any detector runs, so one bad parameter does not waste the others' fits.
+    check_parameters(algorithms, parameters)
+
+    try:
+        # Preprocess once; every detector reads the same matrix.
+        X = StandardScaler().fit_transform(df.values)
+
+        with ThreadPoolExecutor(max_workers=max_workers or len(algorithms)) as pool:
+            futures = {a: pool.submit(SCORERS[a], X, **parameters.get(a, {})) for a in algorithms}
+            scores = {a: future.result() for a, future in futures.items()}
+
+        combined = np.mean([rank_normalize(s) for s in scores.values()], axis=0)
+        return {'scores': {a: s.tolist() for a, s in scores.items()},
+                'combined': combined.tolist()}
+
+    except (ValueError, TypeError):
+        # Parameter values (e.g. contamination=5) are only validated by the estimators.
+        raise
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return None
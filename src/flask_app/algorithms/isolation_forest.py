@@ -1,27 +1,61 @@
+import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 
-def detect_anomalies_iforest(df, contamination=0.1, n_estimators=100, max_samples='auto', random_state=42):
+# Each tree only sees max_samples rows, so larger references are subsampled to this many rows before fitting.
+FIT_ROWS = 200000
+# Batches larger than this are scored in chunks of this size on a thread pool.
+SCORE_CHUNK_ROWS = 50000
+
+def subsample(X, rows, random_state=None):
+    if rows and len(X) > rows:
+        return X[np.random.default_rng(random_state).choice(len(X), rows, replace=False)]
+    return X
+
+def fit_iforest(df, contamination=0.1, n_estimators=100, max_samples='auto', random_state=42, n_jobs=-1,
+                fit_rows=FIT_ROWS):
+    # Preprocess data
+    X = subsample(df.values, fit_rows, random_state)
+    scaler = StandardScaler()
+    X = scaler.fit_transform(X)
+
+    # Fit Isolation Forest with user-provided parameters, building the trees on all cores
+    clf = IsolationForest(contamination=contamination,
+                          n_estimators=n_estimators,
+                          max_samples=max_samples,
+                          random_state=random_state,
+                          n_jobs=n_jobs)
+    clf.fit(X)
+    return scaler, clf
+
+def decision_in_chunks(clf, X, chunk_rows=SCORE_CHUNK_ROWS, n_jobs=-1):
+    # Scoring runs mostly in NumPy/Cython code that releases the GIL,
+    # so large batches are split into chunks scored on parallel threads
+    if len(X) <= chunk_rows:
+        return clf.decision_function(X)
+    parts = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(clf.decision_function)(X[start:start + chunk_rows]) for start in range(0, len(X), chunk_rows))
+    return np.concatenate(parts)
+
+def score_iforest(scaler, clf, df, chunk_rows=SCORE_CHUNK_ROWS, n_jobs=-1):
+    # Predict anomaly scores
+    return decision_in_chunks(clf, scaler.transform(df.values), chunk_rows, n_jobs)
+
+def detect_anomalies_iforest(df, contamination=0.1, n_estimators=100, max_samples='auto', random_state=42,
+                             n_jobs=-1, fit_rows=FIT_ROWS):
 
     try:
         # Ensure data is numerical
         if not pd.api.types.is_numeric_dtype(df.dtypes.all()):
             raise ValueError("Data must contain only numerical values.")
 
-        # Preprocess data
-        scaler = StandardScaler()
-        X = scaler.fit_transform(df.values)
-
-        # Fit Isolation Forest with user-provided parameters
-        clf = IsolationForest(contamination=contamination,
-                              n_estimators=n_estimators,
-                              max_samples=max_samples,
-                              random_state=random_state)
-        clf.fit(X)
-
-        # Predict anomaly scores
-        anomaly_scores = clf.decision_function(X)
+        # Fit on (a sample of) the data, then score every row in parallel chunks
+        scaler, clf = fit_iforest(df, contamination=contamination, n_estimators=n_estimators,
+                                  max_samples=max_samples, random_state=random_state, n_jobs=n_jobs,
+                                  fit_rows=fit_rows)
+        anomaly_scores = score_iforest(scaler, clf, df, n_jobs=n_jobs)
 
         return anomaly_scores.tolist()
 
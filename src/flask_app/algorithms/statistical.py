@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+# Each detector comes twice: a class scoring one sample at a time for streams, and a vectorized
+# function scoring a whole (rows, features) array at once. Both give the same scores for the same
+# sequence: threshold - max |z| over the features, negative for anomalies, None/NaN while warming up.
+
+MAD_SCALE = 0.6745  # makes the MAD of normal data comparable to a standard deviation
+
+
+def _score(deviation, spread, threshold, min_std):
+    return threshold - np.max(np.abs(deviation) / np.maximum(spread, min_std), axis=-1)
+
+
+class RollingZScore:
+    """Z-score against the mean/std of the previous `window` samples, kept as running sums over a ring buffer."""
+
+    def __init__(self, window=60, threshold=3.0, min_std=1e-6):
+        self.window = window
+        self.threshold = threshold
+        self.min_std = min_std
+        self.buffer = None
+        self.pos = 0
+        self.count = 0
+
+    def score(self, x):
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        if self.buffer is None:
+            self.buffer = np.zeros((self.window, len(x)))
+            self.sum = np.zeros(len(x))
+            self.sumsq = np.zeros(len(x))
+        score = None
+        if self.count >= self.window:
+            mean = self.sum / self.window
+            std = np.sqrt(np.maximum(self.sumsq / self.window - mean ** 2, 0))
+            score = float(_score(x - mean, std, self.threshold, self.min_std))
+            old = self.buffer[self.pos]
+            self.sum -= old
+            self.sumsq -= old ** 2
+        self.buffer[self.pos] = x
+        self.sum += x
+        self.sumsq += x ** 2
+        self.pos = (self.pos + 1) % self.window
+        self.count += 1
+        if self.pos == 0:
+            # Recompute the sums once per window so rounding errors cannot build up.
+            self.sum = self.buffer.sum(axis=0)
+            self.sumsq = (self.buffer ** 2).sum(axis=0)
+        return score
+
+
+def rolling_zscore_scores(X, window=60, threshold=3.0, min_std=1e-6):
+    frame = pd.DataFrame(X)
+    rolling = frame.rolling(window)
+    mean = rolling.mean().shift(1).to_numpy()
+    std = rolling.std(ddof=0).shift(1).to_numpy()
+    return _score(X - mean, std, threshold, min_std)
+
+
+class EWMADetector:
+    """Z-score against an exponentially weighted mean and variance; `alpha` is the weight of the newest sample."""
+
+    def __init__(self, alpha=0.1, threshold=3.0, warmup=30, min_std=1e-6):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_std = min_std
+        self.mean = None
+        self.count = 0
+
+    def score(self, x):
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        if self.mean is None:
+            self.mean = x.copy()
+            self.var = np.zeros(len(x))
+            self.count = 1
+            return None
+        d = x - self.mean
+        score = None
+        if self.count >= self.warmup:
+            score = float(_score(d, np.sqrt(self.var), self.threshold, self.min_std))
+        self.mean += self.alpha * d
+        self.var = (1 - self.alpha) * (self.var + self.alpha * d ** 2)
+        self.count += 1
+        return score
+
+
+def _ewm(values, alpha, first):
+    """Run y_t = alpha * v_t + (1 - alpha) * y_(t-1) down axis 0, starting from y_(-1) = first, as an IIR filter."""
+    return lfilter([alpha], [1, alpha - 1], values, axis=0, zi=((1 - alpha) * first)[None, :])[0]
+
+
+def ewma_scores(X, alpha=0.1, threshold=3.0, warmup=30, min_std=1e-6):
+    X = np.asarray(X, dtype=float)
+    scores = np.full(len(X), np.nan)
+    if len(X) < 2:
+        return scores
+    means = np.concatenate([X[:1], _ewm(X[1:], alpha, X[0])])
+    d = X[1:] - means[:-1]
+    # var_t = (1 - alpha) * (var_(t-1) + alpha * d_t^2) is the same filter applied to (1 - alpha) * d^2.
+    var = np.concatenate([np.zeros((1, X.shape[1])), _ewm((1 - alpha) * d ** 2, alpha, np.zeros(X.shape[1]))])
+    scores[1:] = _score(d, np.sqrt(var[:-1]), threshold, min_std)
+    scores[:warmup] = np.nan
+    return scores
+
+
+class RollingMAD:
+    """Robust z-score, 0.6745 * (x - median) / MAD, over the previous `window` samples.
+
+    The median needs the whole window, so each sample costs O(window) in
+    NumPy rather than O(1); with windows of a few hundred samples that is
+    still microseconds.
+    """
+
+    def __init__(self, window=60, threshold=3.5, min_mad=1e-6):
+        self.window = window
+        self.threshold = threshold
+        self.min_mad = min_mad
+        self.buffer = None
+        self.pos = 0
+        self.count = 0
+
+    def score(self, x):
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        if self.buffer is None:
+            self.buffer = np.zeros((self.window, len(x)))
+        score = None
+        if self.count >= self.window:
+            median = np.median(self.buffer, axis=0)
+            mad = np.median(np.abs(self.buffer - median), axis=0)
+            score = float(_score(MAD_SCALE * (x - median), mad, self.threshold, self.min_mad))
+        self.buffer[self.pos] = x
+        self.pos = (self.pos + 1) % self.window
+        self.count += 1
+        return score
+
+
+def rolling_mad_scores(X, window=60, threshold=3.5, min_mad=1e-6, chunk_rows=10000):
+    X = np.asarray(X, dtype=float)
+    scores = np.full(len(X), np.nan)
+    if len(X) <= window:
+        return scores
+    # windows[i] holds rows i .. i + window - 1 and scores row i + window.
+    windows = sliding_window_view(X[:-1], window, axis=0)
+    for start in range(0, len(windows), chunk_rows):
+        chunk = windows[start:start + chunk_rows]
+        median = np.median(chunk, axis=-1)
+        mad = np.median(np.abs(chunk - median[..., None]), axis=-1)
+        rows = slice(start + window, start + window + len(chunk))
+        scores[rows] = _score(MAD_SCALE * (X[rows] - median), mad, threshold, min_mad)
+    return scores
+
+
+class SeasonalResidual:
+    """Z-score of the residual against a per-phase seasonal profile.
+
+    Sample n falls in phase n % `period`; each phase keeps an exponentially
+    weighted level, and the residuals share one exponentially weighted
+    variance. Scoring starts after `warmup` full seasons.
+    """
+
+    def __init__(self, period=24, alpha=0.1, threshold=3.0, warmup=2, min_std=1e-6):
+        self.period = period
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_std = min_std
+        self.profile = None
+        self.count = 0
+
+    def score(self, x):
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        phase = self.count % self.period
+        self.count += 1
+        if self.profile is None:
+            self.profile = np.zeros((self.period, len(x)))
+            self.var = np.zeros(len(x))
+        if self.count <= self.period:
+            self.profile[phase] = x
+            return None
+        r = x - self.profile[phase]
+        score = None
+        if self.count > self.warmup * self.period:
+            score = float(_score(r, np.sqrt(self.var), self.threshold, self.min_std))
+        self.profile[phase] += self.alpha * r
+        self.var = (1 - self.alpha) * self.var + self.alpha * r ** 2
+        return score
+
+
+def seasonal_scores(X, period=24, alpha=0.1, threshold=3.0, warmup=2, min_std=1e-6):
+    X = np.asarray(X, dtype=float)
+    n, n_features = X.shape
+    scores = np.full(n, np.nan)
+    if n <= period:
+        return scores
+    # One row per season, so every phase's level is a filter down axis 0.
+    seasons = -(-n // period)
+    padded = np.full((seasons * period, n_features), np.nan)
+    padded[:n] = X
+    by_season = padded.reshape(seasons, period * n_features)
+    levels = _ewm(by_season[1:], alpha, by_season[0])
+    prior = np.concatenate([by_season[:1], levels[:-1]]).reshape(-1, n_features)[:n - period]
+    r = X[period:] - prior
+    var = _ewm(r ** 2, alpha, np.zeros(n_features))
+    prior_var = np.concatenate([np.zeros((1, n_features)), var[:-1]])
+    scores[period:] = _score(r, np.sqrt(prior_var), threshold, min_std)
+    scores[:warmup * period] = np.nan
+    return scores
+
+
+# name -> (streaming class, batch function); both take the same parameters.
+STATISTICAL_DETECTORS = {
+    'rolling_zscore': (RollingZScore, rolling_zscore_scores),
+    'ewma': (EWMADetector, ewma_scores),
+    'rolling_mad': (RollingMAD, rolling_mad_scores),
+    'seasonal': (SeasonalResidual, seasonal_scores),
+}
+
+
+def detect_anomalies_statistical(df, algorithm, **parameters):
+
+    try:
+        # Ensure data is numerical
+        if not pd.api.types.is_numeric_dtype(df.dtypes.all()):
+            raise ValueError("Data must contain only numerical values.")
+
+        scores = STATISTICAL_DETECTORS[algorithm][1](df.to_numpy(dtype=float), **parameters)
+
+        # Samples still inside the warm-up window have no score
+        return [None if np.isnan(s) else float(s) for s in scores]
+
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return None
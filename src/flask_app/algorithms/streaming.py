@@ -0,0 +1,204 @@
+import logging
+import threading
+from collections import deque
+from numbers import Number
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from algorithms.statistical import STATISTICAL_DETECTORS
+from algorithms.svm import ApproximateOneClassSVM
+
+
+DEVICE_KEYS = ('device', 'device_id')
+
+
+def extract_records(message, features=None):
+    """Turn a decoded MQTT message into a list of (timestamp, device, fields, values) records.
+
+    Accepts a bare number, a dict of numeric fields or a list of either. A
+    'device' or 'device_id' key names the sending device; it is not a feature.
+    """
+    entries = message if isinstance(message, list) else [message]
+    records = []
+    for entry in entries:
+        if isinstance(entry, Number) and not isinstance(entry, bool):
+            records.append((None, None, ('value',), [float(entry)]))
+        elif isinstance(entry, dict):
+            device = next((str(entry[k]) for k in DEVICE_KEYS if k in entry), None)
+            if features:
+                fields = tuple(features)
+            else:
+                fields = tuple(k for k in entry if k != 'timestamp' and k not in DEVICE_KEYS)
+            values = [entry.get(f) for f in fields]
+            if values and all(isinstance(v, Number) and not isinstance(v, bool) for v in values):
+                records.append((entry.get('timestamp'), device, fields, [float(v) for v in values]))
+    return records
+
+
+class RunningScaler:
+    """Standard scaler updated one sample at a time with Welford's algorithm."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, x):
+        if self.mean is None:
+            self.mean = np.zeros_like(x)
+            self.m2 = np.zeros_like(x)
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def std(self):
+        if self.n < 2:
+            return np.ones_like(self.mean)
+        std = np.sqrt(self.m2 / (self.n - 1))
+        std[std == 0] = 1.0
+        return std
+
+    def transform(self, x):
+        return (x - self.mean) / self.std
+
+
+class StreamingZScoreDetector:
+    """O(1) per message: running mean/std per feature, anomaly when any |z| exceeds the threshold.
+
+    Scores follow the batch detectors' convention: negative means anomalous.
+    Anomalies are kept out of the running statistics, but `patience`
+    consecutive anomalies are taken as a level shift: the statistics restart
+    from those samples, so the detector follows the new level.
+    """
+
+    def __init__(self, threshold=3.0, warmup=30, patience=30):
+        self.threshold = threshold
+        self.warmup = warmup
+        self.scaler = RunningScaler()
+        self.outliers = deque(maxlen=max(int(patience), 1))
+
+    def score(self, x):
+        x = np.asarray(x, dtype=float)
+        if self.scaler.n < self.warmup:
+            self.scaler.update(x)
+            return None
+        score = float(self.threshold - np.max(np.abs(self.scaler.transform(x))))
+        if score >= 0:
+            self.outliers.clear()
+            self.scaler.update(x)
+            return score
+        self.outliers.append(x)
+        if len(self.outliers) == self.outliers.maxlen:
+            self.scaler = RunningScaler()
+            for outlier in self.outliers:
+                self.scaler.update(outlier)
+            self.outliers.clear()
+        return score
+
+
+class SlidingWindowIForest:
+    """Isolation Forest fitted on a warm-up window and refreshed in the background.
+
+    Messages are scored against the current model as they arrive; once the
+    warm-up window is full, and then every `refit_every` messages, a forest
+    is trained on the sliding window in a separate thread and swapped in, so
+    scoring, which runs on the MQTT network thread, never waits on a fit. It
+    returns None until the first fit ends. Tree splits are invariant to
+    per-feature scaling, so raw values are used.
+    """
+
+    def __init__(self, window=2000, warmup=200, refit_every=1000, contamination=0.1,
+                 n_estimators=100, max_samples='auto', random_state=42):
+        self.window = deque(maxlen=window)
+        self.warmup = warmup
+        self.refit_every = refit_every
+        self.params = dict(contamination=contamination, n_estimators=n_estimators,
+                           max_samples=max_samples, random_state=random_state)
+        self.model = None
+        self.since_fit = 0
+        self.fitting = False
+
+    def _fit(self, X):
+        try:
+            model = IsolationForest(**self.params).fit(X)
+            self.model = model
+        except Exception as e:
+            logging.error(f'Streaming Isolation Forest refit failed: {str(e)}')
+        finally:
+            self.fitting = False
+
+    def _schedule_fit(self):
+        self.fitting = True
+        self.since_fit = 0
+        threading.Thread(target=self._fit, args=(np.array(self.window),), daemon=True).start()
+
+    def score(self, x):
+        x = np.asarray(x, dtype=float)
+        self.window.append(x)
+        self.since_fit += 1
+
+        due = self.model is None or self.since_fit >= self.refit_every
+        if due and not self.fitting and len(self.window) >= self.warmup:
+            self._schedule_fit()
+        # Until the first fit finishes there is nothing to score with.
+        model = self.model
+        if model is None:
+            return None
+        return float(model.decision_function(x.reshape(1, -1))[0])
+
+
+class StreamingOneClassSVM:
+    """Approximate One-Class SVM fitted on a warm-up window and updated with partial_fit.
+
+    The scaler and kernel feature map are fixed after warm-up; every
+    `update_every` messages are fed to the model as one SGD batch, so it
+    follows slow drift without refitting. Anomalous messages are kept in the
+    batches: `nu` already expects that fraction of outliers, and dropping
+    them would shrink the boundary with every update.
+    """
+
+    def __init__(self, warmup=200, update_every=100, nu=0.1, kernel='rbf', gamma='auto', n_components=100):
+        self.warmup = warmup
+        self.update_every = update_every
+        self.window = []
+        self.batch = []
+        self.scaler = None
+        self.model = ApproximateOneClassSVM(nu=nu, kernel=kernel, gamma=gamma, n_components=n_components)
+
+    def score(self, x):
+        x = np.asarray(x, dtype=float)
+        if self.scaler is None:
+            self.window.append(x)
+            if len(self.window) >= self.warmup:
+                X = np.array(self.window)
+                self.scaler = StandardScaler().fit(X)
+                self.model.fit(self.scaler.transform(X))
+                self.window = []
+            return None
+
+        z = self.scaler.transform(x.reshape(1, -1))
+        score = float(self.model.decision_function(z)[0])
+        self.batch.append(z[0])
+        if len(self.batch) >= self.update_every:
+            self.model.partial_fit(np.array(self.batch))
+            self.batch = []
+        return score
+
+
+STREAM_DETECTORS = {
+    'zscore': StreamingZScoreDetector,
+    'isolation_forest': SlidingWindowIForest,
+    'SVM': StreamingOneClassSVM,
+    # Sliding-window statistics: O(1) state per topic and no model to refit.
+    **{name: detector for name, (detector, _) in STATISTICAL_DETECTORS.items()},
+}
+
+
+def make_stream_detector(algorithm, **parameters):
+    if algorithm not in STREAM_DETECTORS:
+        raise ValueError(f'Unknown streaming algorithm: {algorithm}')
+    return STREAM_DETECTORS[algorithm](**parameters)
@@ -1,25 +1,117 @@
+import numpy as np
 import pandas as pd
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import SGDOneClassSVM
 from sklearn.metrics import precision_score, recall_score, f1_score
 from sklearn.svm import OneClassSVM
 from sklearn.preprocessing import StandardScaler
 
-def detect_anomalies_svm(df, nu=0.1, kernel="rbf", gamma="auto"):
+# Above this many rows the exact One-Class SVM is replaced by ApproximateOneClassSVM.
+APPROXIMATE_SVM_ROWS = 20000
+
+
+def kernel_gamma(gamma, X):
+    """Resolve OneClassSVM's 'auto'/'scale' gamma to a number for the kernel approximations."""
+    if gamma == 'auto':
+        return 1.0 / X.shape[1]
+    if gamma == 'scale':
+        var = X.var()
+        return 1.0 / (X.shape[1] * var) if var > 0 else 1.0
+    return float(gamma)
+
+
+class ApproximateOneClassSVM:
+    """One-Class SVM fitted in time linear in the number of rows.
+
+    Features are mapped with a Nystroem approximation of the RBF kernel (or
+    random Fourier features with feature_map='rff') and a linear one-class
+    SVM is fitted on them with SGD. The linear kernel skips the mapping.
+    partial_fit updates the model batch by batch; the feature map is fitted
+    on the first batch. Scores follow OneClassSVM: negative means anomalous.
+    """
+
+    def __init__(self, nu=0.1, kernel='rbf', gamma='auto', n_components=300, feature_map='nystroem',
+                 max_iter=20, random_state=42):
+        self.nu = nu
+        self.kernel = kernel
+        self.gamma = gamma
+        self.n_components = n_components
+        self.feature_map = feature_map
+        self.max_iter = max_iter
+        self.random_state = random_state
+        self.mapper = None
+        self.sgd = None
+
+    def _init(self, X):
+        if self.kernel == 'linear':
+            self.mapper = None
+        elif self.feature_map == 'rff':
+            if self.kernel != 'rbf':
+                raise ValueError('Random Fourier features only approximate the rbf kernel')
+            self.mapper = RBFSampler(gamma=kernel_gamma(self.gamma, X), n_components=self.n_components,
+                                     random_state=self.random_state).fit(X)
+        else:
+            self.mapper = Nystroem(kernel=self.kernel, gamma=kernel_gamma(self.gamma, X),
+                                   n_components=min(self.n_components, len(X)),
+                                   random_state=self.random_state).fit(X)
+        self.sgd = SGDOneClassSVM(nu=self.nu, max_iter=self.max_iter, tol=None, random_state=self.random_state)
+
+    def transform(self, X):
+        return X if self.mapper is None else self.mapper.transform(X)
+
+    def fit(self, X):
+        self._init(X)
+        self.sgd.fit(self.transform(X))
+        return self
+
+    def partial_fit(self, X):
+        if self.sgd is None:
+            self._init(X)
+        self.sgd.partial_fit(self.transform(X))
+        return self
+
+    def decision_function(self, X):
+        return self.sgd.decision_function(self.transform(X))
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+
+def make_svm(n_rows, nu=0.1, kernel="rbf", gamma="auto", approximate=None, n_components=300, feature_map='nystroem'):
+    """The exact SVM is quadratic or worse in the number of rows, so large inputs (or `approximate`) get ApproximateOneClassSVM."""
+    if approximate is None:
+        approximate = n_rows > APPROXIMATE_SVM_ROWS
+    if approximate:
+        return ApproximateOneClassSVM(nu=nu, kernel=kernel, gamma=gamma, n_components=n_components,
+                                      feature_map=feature_map)
+    return OneClassSVM(nu=nu, kernel=kernel, gamma=gamma)
+
+
+def fit_svm(df, nu=0.1, kernel="rbf", gamma="auto", approximate=None, n_components=300, feature_map='nystroem'):
+    # Preprocess data
+    scaler = StandardScaler()
+    X = scaler.fit_transform(df.values)
+
+    # Fit One-Class SVM with user-provided parameters
+    svm = make_svm(len(X), nu, kernel, gamma, approximate, n_components, feature_map)
+    svm.fit(X)
+    return scaler, svm
+
+def score_svm(scaler, svm, df):
+    # Predict anomalies
+    return svm.predict(scaler.transform(df.values))
+
+def detect_anomalies_svm(df, nu=0.1, kernel="rbf", gamma="auto", approximate=None, n_components=300,
+                         feature_map='nystroem'):
 
     try:
         # Ensure data is numerical
         if not pd.api.types.is_numeric_dtype(df.dtypes.all()):
             raise ValueError("Data must contain only numerical values.")
 
-        # Preprocess data
-        scaler = StandardScaler()
-        X = scaler.fit_transform(df.values)
-
-        # Fit One-Class SVM with user-provided parameters
-        svm = OneClassSVM(nu=nu, kernel=kernel, gamma=gamma)
-        svm.fit(X)
-
-        # Predict anomalies
-        y_pred = svm.predict(X)
+        scaler, svm = fit_svm(df, nu=nu, kernel=kernel, gamma=gamma, approximate=approximate,
+                              n_components=n_components, feature_map=feature_map)
+        y_pred = score_svm(scaler, svm, df)
 
         # Optionally evaluate the model (using true labels if available)
         if "true_labels" in df.columns:
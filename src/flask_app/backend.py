@@ -2,14 +2,31 @@ from flask import Flask, request, jsonify
 from algorithms.dbscan import detect_anomalies_dbscan
 from algorithms.svm import detect_anomalies_svm
 from algorithms.isolation_forest import detect_anomalies_iforest
+from algorithms.statistical import STATISTICAL_DETECTORS, detect_anomalies_statistical
+from algorithms.streaming import make_stream_detector
+from algorithms.ensemble import SCORERS, detect_anomalies_ensemble
 import logging
+import numpy as np
 import pandas as pd
 import hashlib
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta
 import uuid
-import paho.mqtt.client as mqtt
 import json
+import os
+import functools
+import threading
+import time
+from mqtt_manager import MQTTSubscriberManager
+from timeseries_store import TIERS, TimeSeriesStore
+from model_registry import ModelRegistry
+from result_cache import ResultCache
+from hashing import request_key
+from columnar import NPY_CONTENT_TYPE, frame_from_npy, frame_to_npy
+from downsample import METHODS, series_range
+from jobs import JobManager, FINISHED
+from alerts import AlertEngine, FileSink, WebhookSink, make_rule
+from classifier_service import TrafficClassifier
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -49,6 +66,158 @@ class Token(db.Model):
 with app.app_context():
     db.create_all()
 
+app.config.setdefault('ALERT_RULES', [{'type': 'threshold'},
+                                      {'type': 'consecutive', 'count': 5},
+                                      {'type': 'rate', 'count': 20, 'window': 60}])
+app.config.setdefault('ALERT_DEDUP_WINDOW', 60)  # seconds a rule must stay quiet on a source before a new alert
+app.config.setdefault('ALERT_RATE_LIMIT', 10)  # alerts sent per user and source ...
+app.config.setdefault('ALERT_RATE_PERIOD', 60)  # ... per this many seconds
+app.config.setdefault('ALERT_QUEUE_SIZE', 10000)  # score batches waiting for evaluation; more are dropped
+app.config.setdefault('ALERT_STATE_TTL', 3600)  # seconds a source may stay silent before its rule state is dropped
+# JSON lines, None disables. The instance folder sits next to the package and holds the SQLite database too.
+app.config.setdefault('ALERT_FILE', os.path.join(app.instance_path, 'alerts.log'))
+app.config.setdefault('ALERT_WEBHOOK_URL', None)
+alert_engine = AlertEngine([make_rule(rule) for rule in app.config['ALERT_RULES']],
+                           dedup_window=app.config['ALERT_DEDUP_WINDOW'],
+                           rate_limit=app.config['ALERT_RATE_LIMIT'],
+                           rate_period=app.config['ALERT_RATE_PERIOD'],
+                           queue_size=app.config['ALERT_QUEUE_SIZE'],
+                           state_ttl=app.config['ALERT_STATE_TTL'])
+if app.config['ALERT_FILE']:
+    alert_engine.add_sink(FileSink(app.config['ALERT_FILE']))
+if app.config['ALERT_WEBHOOK_URL']:
+    alert_engine.add_sink(WebhookSink(app.config['ALERT_WEBHOOK_URL']))
+
+def alert_scores(algorithm, result, rows, noise_only=False):
+    """Scores to alert on for a detection result, negative meaning anomalous.
+
+    DBSCAN gives cluster labels, or with `noise_only` the positions of the
+    noise rows, rather than scores: noise rows score -1 and the rest 0.
+    """
+    if algorithm != 'DBSCAN':
+        return result
+    scores = np.zeros(rows)
+    if noise_only:
+        scores[np.asarray(result, dtype=np.int64)] = -1.0
+    else:
+        scores[np.asarray(result) == -1] = -1.0
+    return scores
+
+def alert_on_job(job):
+    scores = alert_scores(job.algorithm, job.result, job.rows, job.parameters.get('noise_only', False))
+    alert_engine.submit(f'job/{job.algorithm}/{job.id}', scores, user=job.user, reset=True)
+
+def alert_on_records(topic, records):
+    # One batch per device, so rules keep separate state for every sensor.
+    devices = {}
+    for record in records:
+        devices.setdefault(record['device'], []).append(record)
+    for device, batch in devices.items():
+        source = f'mqtt/{topic}' if device is None else f'mqtt/{topic}/{device}'
+        alert_engine.submit(source, [r['score'] for r in batch], [r['received_at'] for r in batch])
+
+app.config.setdefault('MQTT_BUFFER_SIZE', 1000)
+app.config.setdefault('MQTT_CONNECT_TIMEOUT', 5)  # seconds a new subscription waits for the broker
+app.config.setdefault('MQTT_MAX_DETECTORS', 1000)  # per-device streaming detectors kept per subscription
+app.config.setdefault('SSE_KEEPALIVE', 15)  # seconds between keep-alive comments on an idle event stream
+app.config.setdefault('SSE_MIN_INTERVAL', 0.1)  # seconds; records arriving faster are batched into one event
+# Every open event stream holds a server thread, so gunicorn.conf.py keeps this below its thread count.
+app.config.setdefault('SSE_MAX_STREAMS', 32)
+app.config.setdefault('TIMESERIES_RAW_POINTS', 100000)  # per topic/device
+app.config.setdefault('TIMESERIES_MINUTE_POINTS', 7 * 24 * 60)
+app.config.setdefault('TIMESERIES_HOUR_POINTS', 365 * 24)
+app.config.setdefault('TIMESERIES_MAX_AGE', 24 * 3600)  # seconds of raw samples kept, None keeps them until overwritten
+app.config.setdefault('TIMESERIES_MAX_SERIES', 1000)  # topic/device series per broker; the longest idle one is dropped
+mqtt_manager = MQTTSubscriberManager(
+    buffer_size=app.config['MQTT_BUFFER_SIZE'],
+    store_factory=functools.partial(TimeSeriesStore,
+                                    raw_capacity=app.config['TIMESERIES_RAW_POINTS'],
+                                    minute_capacity=app.config['TIMESERIES_MINUTE_POINTS'],
+                                    hour_capacity=app.config['TIMESERIES_HOUR_POINTS'],
+                                    max_age=app.config['TIMESERIES_MAX_AGE'],
+                                    max_series=app.config['TIMESERIES_MAX_SERIES']),
+    on_records=alert_on_records,
+    max_detectors=app.config['MQTT_MAX_DETECTORS'])
+
+app.config.setdefault('MODEL_REGISTRY_CAPACITY', 16)
+app.config.setdefault('MODEL_REGISTRY_DIR', None)  # e.g. 'models/registry' to persist fitted models with joblib
+app.config.setdefault('MODEL_REGISTRY_DISK_CAPACITY', 256)  # model files kept in MODEL_REGISTRY_DIR, least recently used out
+model_registry = ModelRegistry(capacity=app.config['MODEL_REGISTRY_CAPACITY'],
+                               persist_dir=app.config['MODEL_REGISTRY_DIR'],
+                               disk_capacity=app.config['MODEL_REGISTRY_DISK_CAPACITY'])
+
+app.config.setdefault('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+app.config.setdefault('RESULT_CACHE_TTL', 600)  # seconds, None disables expiry
+result_cache = ResultCache(max_bytes=app.config['RESULT_CACHE_MAX_BYTES'], ttl=app.config['RESULT_CACHE_TTL'])
+
+app.config.setdefault('SERIES_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+app.config.setdefault('SERIES_CACHE_TTL', 3600)  # seconds an uploaded chart series is kept after its last use
+app.config.setdefault('SERIES_MAX_POINTS', 10000)  # per column and range request
+# Chart series are kept as .npy bytes, so a range request maps them back without copying.
+series_cache = ResultCache(max_bytes=app.config['SERIES_CACHE_MAX_BYTES'], ttl=app.config['SERIES_CACHE_TTL'],
+                           sliding=True)
+
+app.config.setdefault('SYNC_MAX_ROWS', 50000)  # rows a request may fit or score a model on; longer frames go to /jobs
+app.config.setdefault('JOB_WORKERS', None)  # defaults to the number of CPUs
+app.config.setdefault('JOB_MAX_FINISHED', 100)
+app.config.setdefault('JOB_MAX_RESULT_BYTES', 256 * 1024 * 1024)
+job_manager = JobManager(max_workers=app.config['JOB_WORKERS'],
+                         max_finished=app.config['JOB_MAX_FINISHED'],
+                         max_result_bytes=app.config['JOB_MAX_RESULT_BYTES'],
+                         on_finished=alert_on_job)
+
+app.config.setdefault('CLASSIFIER_MODEL_DIR', os.path.join(app.root_path, 'models'))
+app.config.setdefault('CLASSIFIER_MODELS', {
+    'predictions_8': 'newRandomForest_model_8_classes.joblib',
+    'predictions_2': 'newRandomForest_model_2_classes.joblib',
+})
+app.config.setdefault('CLASSIFIER_MMAP_MODE', 'r')
+traffic_classifier = TrafficClassifier(
+    {name: os.path.join(app.config['CLASSIFIER_MODEL_DIR'], path) for name, path in app.config['CLASSIFIER_MODELS'].items()},
+    mmap_mode=app.config['CLASSIFIER_MMAP_MODE'])
+
+
+def preload():
+    """Load the classifier models now instead of on the first request.
+
+    gunicorn calls this before forking its workers (see gunicorn.conf.py), so
+    they all share the loaded models copy-on-write.
+    """
+    for name, available in traffic_classifier.available().items():
+        if available:
+            traffic_classifier.model(name)
+            logging.info(f'Preloaded classifier model {name}')
+        else:
+            logging.warning(f'Classifier model {name} not found, it will be loaded on first use.')
+
+
+def shutdown(timeout=10):
+    """Stop the background work of this process before it exits.
+
+    Open event streams get their "end" event, MQTT connections close, queued
+    and running jobs are cancelled, and pending alerts get up to `timeout`
+    seconds to reach the sinks.
+    """
+    mqtt_manager.close()
+    job_manager.shutdown(wait=False)
+    if not alert_engine.flush(timeout):
+        logging.warning('Alerts still queued at shutdown were dropped.')
+
+def subscribe_topic(broker, port, topic):
+    """Subscribe to `topic` and wait for the broker; returns (connected, subscribed).
+
+    A new subscription whose broker does not answer is rolled back, so a wrong
+    broker or port does not leave a connection retrying forever. Existing
+    subscriptions are kept while their broker is down.
+    """
+    created = mqtt_manager.subscribe(broker, port, topic)
+    connected = mqtt_manager.wait_connected(broker, port, app.config['MQTT_CONNECT_TIMEOUT'])
+    if not connected and created:
+        mqtt_manager.unsubscribe(broker, port, topic)
+        return False, False
+    return connected, True
+
+
 def generate_token(user_id):
     expiration_time = datetime.utcnow() + timedelta(minutes=30)
     token = str(uuid.uuid4())
@@ -60,26 +229,66 @@ def generate_token(user_id):
     db.session.commit()
     return token
 
-def on_connect(client, userdata, flags, rc, topic):
-    if rc == 0:
-        logging.info(f'Connected successfully with result code {rc}')
-        client.payload = client.subscribe(topic)
-    else:
-        logging.error(f'Connection failed with result code {rc}')
+class InvalidRequest(Exception):
+    pass
 
-def on_message(client, userdata, msg):
-    payload = str(msg.payload.decode("utf-8"))
-    if payload:
+def read_frame_request(*required):
+    """Return (DataFrame, fields) from a JSON body or a binary .npy body.
+
+    JSON bodies carry the frame as column lists under "data". Binary bodies are
+    a column-major float .npy matrix, with the other fields passed as query
+    arguments ("columns", "parameters" and "algorithms" JSON-encoded).
+    """
+    content_type = request.headers.get('Content-Type', '')
+    if content_type == 'application/json':
+        data = request.json
+        if not data or any(k not in data for k in ('data',) + required):
+            expected = ' and '.join(f'"{k}"' for k in ('data',) + required)
+            raise InvalidRequest(f'Invalid JSON format. Expected {expected} keys.')
+        return pd.DataFrame(data['data']), data
+    if content_type == NPY_CONTENT_TYPE:
+        fields = request.args.to_dict()
+        if any(k not in fields for k in required):
+            expected = ' and '.join(f'"{k}"' for k in required)
+            raise InvalidRequest(f'Invalid query arguments. Expected {expected}.')
         try:
-            message_json = json.loads(payload)
-            userdata['payload'] = message_json
-            return message_json
-        except json.JSONDecodeError:
-            logging.warning("Failed to parse payload as JSON.")
-            userdata['payload'] = None
-            return None
-    logging.info("Received payload: %s", payload)
-    return None
+            for key in ('columns', 'parameters', 'algorithms'):
+                if key in fields:
+                    fields[key] = json.loads(fields[key])
+            df = frame_from_npy(request.get_data(cache=False), fields.get('columns'))
+        except ValueError as e:
+            raise InvalidRequest(f'Invalid binary payload: {str(e)}')
+        return df, fields
+    raise InvalidRequest(f'Invalid content type. Expected JSON data or {NPY_CONTENT_TYPE}.')
+
+
+def too_long(df, hint=' Submit them to /jobs instead.'):
+    """413 response for frames too long to fit a model on within one request, else None."""
+    limit = app.config['SYNC_MAX_ROWS']
+    if limit is None or len(df) <= limit:
+        return None
+    logging.error(f'{len(df)} rows exceed the limit of {limit} rows per request.')
+    return jsonify({'error': f'{len(df)} rows exceed the limit of {limit} rows per request.{hint}'}), 413
+
+
+open_streams = 0
+open_streams_lock = threading.Lock()
+
+
+def acquire_stream():
+    """Reserve one of the SSE_MAX_STREAMS event stream slots; returns False if all are taken."""
+    global open_streams
+    with open_streams_lock:
+        if open_streams >= app.config['SSE_MAX_STREAMS']:
+            return False
+        open_streams += 1
+        return True
+
+
+def release_stream():
+    global open_streams
+    with open_streams_lock:
+        open_streams -= 1
 
 
 @app.route('/register', methods=['POST'])
@@ -159,25 +368,34 @@ def update_user():
 @app.route('/detect_anomalies', methods=['POST'])
 def detect_anomalies():
     try:
-        if request.headers['Content-Type'] != 'application/json':
-            logging.error('Verify the data format is in JSON')
-            return jsonify({'error': 'Invalid content type. Expected JSON data.'}), 400
-
-        data = request.json
-        if 'data' not in data or 'algorithm' not in data:
-            logging.error('Invalid JSON format. Expected "data" and "algorithm" keys.')
-            return jsonify({'error': 'Invalid JSON format. Expected "data" and "algorithm" keys.'}), 400
+        try:
+            df, data = read_frame_request('algorithm')
+        except InvalidRequest as e:
+            logging.error(str(e))
+            return jsonify({'error': str(e)}), 400
 
-        df = pd.DataFrame(data['data'])
         algorithm = data['algorithm']
         parameters = data.get('parameters', {})
 
+        cache_key = request_key(df, algorithm, parameters)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            logging.info('Success (cached)')
+            return app.response_class(cached, status=200, mimetype='application/json', headers={'X-Cache': 'HIT'})
+
+        # Statistical detectors are a few vectorized passes; only model fits are bounded.
+        rejected = None if algorithm in STATISTICAL_DETECTORS else too_long(df)
+        if rejected is not None:
+            return rejected
+
         if algorithm == 'isolation_forest':
             anomaly_indices = detect_anomalies_iforest(df, **parameters)
         elif algorithm == 'SVM':
             anomaly_indices = detect_anomalies_svm(df, **parameters)
         elif algorithm == 'DBSCAN':
             anomaly_indices = detect_anomalies_dbscan(df, **parameters)
+        elif algorithm in STATISTICAL_DETECTORS:
+            anomaly_indices = detect_anomalies_statistical(df, algorithm, **parameters)
         else:
             logging.error('Invalid algorithm specified')
             return jsonify({'error': 'Invalid algorithm specified.'}), 400
@@ -186,14 +404,316 @@ def detect_anomalies():
             logging.error('An error occurred while detecting anomalies.')
             return jsonify({'error': 'An error occurred while detecting anomalies.'}), 500
 
+        body = json.dumps(anomaly_indices).encode('utf-8')
+        result_cache.put(cache_key, body)
+        # One source per dataset, each scored from a fresh rule state.
+        scores = alert_scores(algorithm, anomaly_indices, len(df), parameters.get('noise_only', False))
+        alert_engine.submit(f'upload/{algorithm}/{cache_key[:12]}', scores, user=data.get('user'), reset=True)
         logging.info('Success')
-        return jsonify(anomaly_indices), 200
+        return app.response_class(body, status=200, mimetype='application/json', headers={'X-Cache': 'MISS'})
     except Exception as e:
         logging.error(f'An error occurred: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
 
 
+@app.route('/detect_anomalies_ensemble', methods=['POST'])
+def detect_anomalies_ensemble_route():
+    try:
+        try:
+            df, data = read_frame_request()
+        except InvalidRequest as e:
+            logging.error(str(e))
+            return jsonify({'error': str(e)}), 400
+
+        algorithms = data.get('algorithms') or list(SCORERS)
+        parameters = data.get('parameters', {})
+        unknown = [a for a in algorithms if a not in SCORERS]
+        if unknown:
+            logging.error(f'Invalid algorithms specified: {unknown}')
+            return jsonify({'error': f'Invalid algorithms specified: {unknown}'}), 400
+
+        cache_key = request_key(df, 'ensemble', {'algorithms': algorithms, 'parameters': parameters})
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            logging.info('Success (cached)')
+            return app.response_class(cached, status=200, mimetype='application/json', headers={'X-Cache': 'HIT'})
+
+        rejected = too_long(df, hint='')
+        if rejected is not None:
+            return rejected
+
+        try:
+            result = detect_anomalies_ensemble(df, algorithms, parameters)
+        except (ValueError, TypeError) as e:
+            logging.error(f'Invalid ensemble request: {str(e)}')
+            return jsonify({'error': str(e)}), 400
+        if result is None:
+            logging.error('An error occurred while detecting anomalies.')
+            return jsonify({'error': 'An error occurred while detecting anomalies.'}), 500
+
+        body = json.dumps(result).encode('utf-8')
+        result_cache.put(cache_key, body)
+        logging.info('Success')
+        return app.response_class(body, status=200, mimetype='application/json', headers={'X-Cache': 'MISS'})
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats()), 200
+
+
+@app.route('/series', methods=['POST'])
+def upload_series():
+    """Keep a frame on the server for charting; /series/<id> then returns downsampled ranges of it.
+
+    An optional "score_column" names a column of anomaly scores (negative is
+    anomalous) whose anomalous rows every range keeps.
+    """
+    try:
+        try:
+            df, data = read_frame_request()
+        except InvalidRequest as e:
+            logging.error(str(e))
+            return jsonify({'error': str(e)}), 400
+
+        score_column = data.get('score_column')
+        if score_column is not None and score_column not in df.columns:
+            logging.error(f'Score column {score_column} not in the frame')
+            return jsonify({'error': f'Score column {score_column} not in the frame.'}), 400
+        if not all(pd.api.types.is_numeric_dtype(t) for t in df.dtypes):
+            logging.error('Chart series must be numeric')
+            return jsonify({'error': 'Data must contain only numerical values.'}), 400
+
+        series_id = request_key(df, 'series', {'score_column': score_column})
+        meta = json.dumps({'columns': [str(c) for c in df.columns], 'score_column': score_column}).encode('utf-8')
+        if not series_cache.put(series_id, frame_to_npy(df)) or not series_cache.put(series_id + ':meta', meta):
+            logging.error('Series is larger than the series cache')
+            return jsonify({'error': 'Series is too large to keep on the server.'}), 413
+        return jsonify({'series_id': series_id, 'rows': len(df)}), 201
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/series/<series_id>', methods=['GET'])
+def series_range_route(series_id):
+    """Rows [start, end) of an uploaded series, reduced to about `points` per column with LTTB or min/max buckets."""
+    try:
+        meta = series_cache.get(series_id + ':meta')
+        body = series_cache.get(series_id)
+        if meta is None or body is None:
+            return jsonify({'error': 'Series not found.'}), 404
+        meta = json.loads(meta)
+
+        start = request.args.get('start', 0, type=int)
+        end = request.args.get('end', None, type=int)
+        points = request.args.get('points', 2000, type=int)
+        if points < 3:
+            logging.error(f'Invalid point budget {points}')
+            return jsonify({'error': 'points must be at least 3.'}), 400
+        points = min(points, app.config['SERIES_MAX_POINTS'])
+        method = request.args.get('method', 'lttb')
+        if method not in METHODS:
+            logging.error(f'Invalid downsampling method {method}')
+            return jsonify({'error': f'Invalid method. Expected one of {list(METHODS)}.'}), 400
+
+        df = frame_from_npy(body, meta['columns'])
+        return jsonify(series_range(df, start, end, points, method, meta['score_column'])), 200
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/alerts', methods=['GET'])
+def list_alerts():
+    """Recent alerts, newest first, filtered by "user", "source" and "status" (open or resolved)."""
+    alerts = alert_engine.alerts(user=request.args.get('user'), source=request.args.get('source'),
+                                 status=request.args.get('status'), limit=request.args.get('limit', 100, type=int))
+    return jsonify({'alerts': alerts, 'stats': alert_engine.stats()}), 200
+
+
+@app.route('/fit_model', methods=['POST'])
+def fit_model():
+    try:
+        try:
+            df, data = read_frame_request('algorithm')
+        except InvalidRequest as e:
+            logging.error(str(e))
+            return jsonify({'error': str(e)}), 400
+
+        rejected = too_long(df, hint='')
+        if rejected is not None:
+            return rejected
+
+        try:
+            model_id, created = model_registry.fit(df, data['algorithm'], data.get('parameters', {}))
+        except (ValueError, TypeError) as e:
+            logging.error(f'Invalid model request: {str(e)}')
+            return jsonify({'error': str(e)}), 400
+
+        logging.info(f"{'Fitted' if created else 'Reused'} {data['algorithm']} model {model_id}")
+        return jsonify({'model_id': model_id, 'created': created}), 201 if created else 200
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/score_model', methods=['POST'])
+def score_model():
+    try:
+        try:
+            df, data = read_frame_request('model_id')
+        except InvalidRequest as e:
+            logging.error(str(e))
+            return jsonify({'error': str(e)}), 400
+
+        model = model_registry.get(data['model_id'])
+        if model is None:
+            logging.error(f"Model {data['model_id']} not found.")
+            return jsonify({'error': 'Model not found.'}), 404
+
+        try:
+            scores = model.score(df)
+        except (KeyError, ValueError) as e:
+            logging.error(f'Invalid scoring request: {str(e)}')
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify(scores.tolist()), 200
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/detect_anomalies_chunk', methods=['POST'])
+def detect_anomalies_chunk():
+    """Score one chunk of a large upload.
+
+    The first chunk (no "model_id") fits a model that is kept in the registry;
+    later chunks pass the returned model_id and are only scored against it.
+    """
+    try:
+        try:
+            df, data = read_frame_request('algorithm')
+        except InvalidRequest as e:
+            logging.error(str(e))
+            return jsonify({'error': str(e)}), 400
+
+        rejected = too_long(df, hint=' Send smaller chunks.')
+        if rejected is not None:
+            return rejected
+
+        model_id = data.get('model_id')
+        first_chunk = not model_id
+        if first_chunk:
+            try:
+                model_id, _ = model_registry.fit(df, data['algorithm'], data.get('parameters', {}))
+            except (ValueError, TypeError) as e:
+                logging.error(f'Invalid model request: {str(e)}')
+                return jsonify({'error': str(e)}), 400
+
+        model = model_registry.get(model_id)
+        if model is None:
+            logging.error(f'Model {model_id} not found.')
+            return jsonify({'error': 'Model not found.'}), 404
+
+        try:
+            scores = model.score(df)
+        except (KeyError, ValueError) as e:
+            logging.error(f'Invalid scoring request: {str(e)}')
+            return jsonify({'error': str(e)}), 400
+
+        # Rule state carries over between the chunks of one upload, not from an earlier upload.
+        alert_engine.submit(f'upload/{model_id}', alert_scores(model.algorithm, scores, len(df)),
+                            user=data.get('user'), reset=first_chunk)
+        return jsonify({'model_id': model_id, 'scores': scores.tolist()}), 200
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    try:
+        try:
+            df, data = read_frame_request('algorithm')
+        except InvalidRequest as e:
+            logging.error(str(e))
+            return jsonify({'error': str(e)}), 400
+
+        try:
+            job = job_manager.submit(df, data['algorithm'], data.get('parameters', {}), user=data.get('user'))
+        except ValueError as e:
+            logging.error(str(e))
+            return jsonify({'error': str(e)}), 400
+
+        logging.info(f"Submitted {data['algorithm']} job {job.id} ({len(df)} rows)")
+        return jsonify(job.to_dict()), 202
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify(job_manager.list()), 200
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    if job.status != FINISHED:
+        return jsonify(job.to_dict()), 409
+    return jsonify(job.result.tolist()), 200
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+    logging.info(f'Cancellation requested for job {job_id}')
+    return jsonify(job.to_dict()), 202
+
+
+@app.route('/classify_traffic', methods=['POST'])
+def classify_traffic():
+    try:
+        try:
+            df, data = read_frame_request()
+        except InvalidRequest as e:
+            logging.error(str(e))
+            return jsonify({'error': str(e)}), 400
+
+        try:
+            predictions = traffic_classifier.classify(df)
+        except FileNotFoundError as e:
+            logging.error(f'Classifier model not available: {str(e)}')
+            return jsonify({'error': 'Classifier model not available.'}), 503
+        except ValueError as e:
+            logging.error(f'Invalid classification request: {str(e)}')
+            return jsonify({'error': str(e)}), 400
+
+        logging.info(f'Classified {len(df)} rows')
+        return jsonify(predictions), 200
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/subscribe_mqtt_topic', methods=['POST'])
 def subscribe_mqtt_topic():
     try:
@@ -205,31 +725,172 @@ def subscribe_mqtt_topic():
         broker = data["broker"]
         topic = data["topic"]
         port = data["port"]
+        limit = int(data.get("limit", 100))
 
-        userdata = {'payload': None}  # Initialize a userdata dictionary
-        
-        client = mqtt.Client()  # Initialize client
-        client.user_data_set(userdata)  # Set the userdata dictionary
-        
-        client.on_connect = lambda client, userdata, flags, rc, topic=topic: on_connect(client, userdata, flags, rc, topic)
-        client.on_message = on_message
-        
-        try:
-            client.connect(broker, port)
-            client.loop_start()  # Start loop in non-blocking mode
-          
-            payload = userdata.get('payload')
-            client.disconnect()  # Disconnect MQTT client
-            
-            return jsonify({'message': 'Successfully subscribed to the MQTT topic.', 'payload': payload}), 200
+        try:
+            # Subscribing is idempotent: the connection and its buffer outlive this request.
+            connected, subscribed = subscribe_topic(broker, port, topic)
         except Exception as e:
             logging.error(f'An error occurred while connecting to MQTT broker: {str(e)}')
             return jsonify({'error': f'An error occurred while connecting to MQTT broker: {str(e)}'}), 500
+        if not subscribed:
+            logging.error(f'Could not connect to MQTT broker {broker}:{port}')
+            return jsonify({'error': f'Could not connect to MQTT broker {broker}:{port}.', 'connected': False}), 502
+
+        messages, received = mqtt_manager.latest(broker, port, topic, limit)
+        payload = messages[-1]['message'] if messages else None
+        return jsonify({'message': 'Successfully subscribed to the MQTT topic.',
+                        'connected': connected,
+                        'payload': payload,
+                        'messages': messages,
+                        'scores': mqtt_manager.latest_scores(broker, port, topic, limit),
+                        'received': received}), 200
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/stream_detection', methods=['POST'])
+def stream_detection():
+    try:
+        data = request.get_json()
+        if not data or not all(k in data for k in ('broker', 'port', 'topic', 'algorithm')):
+            logging.error('Invalid JSON format. Expected "broker", "port", "topic" and "algorithm" keys.')
+            return jsonify({'error': 'Invalid JSON format. Expected "broker", "port", "topic" and "algorithm" keys.'}), 400
+
+        try:
+            detector = make_stream_detector(data['algorithm'], **data.get('parameters', {}))
+        except (ValueError, TypeError) as e:
+            logging.error(f'Invalid streaming detector: {str(e)}')
+            return jsonify({'error': str(e)}), 400
+
+        _, subscribed = subscribe_topic(data['broker'], data['port'], data['topic'])
+        if not subscribed:
+            logging.error(f"Could not connect to MQTT broker {data['broker']}:{data['port']}")
+            return jsonify({'error': f"Could not connect to MQTT broker {data['broker']}:{data['port']}.",
+                            'connected': False}), 502
+        mqtt_manager.attach_detector(data['broker'], data['port'], data['topic'], detector, data.get('features'))
+        logging.info(f"Streaming {data['algorithm']} detection enabled on topic {data['topic']}")
+        return jsonify({'message': 'Streaming detection enabled.'}), 200
     except Exception as e:
         logging.error(f'An error occurred: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/stream_mqtt', methods=['GET'])
+def stream_mqtt():
+    """Server-Sent Events stream of a topic's new records and their anomaly scores.
+
+    Each "records" event carries a JSON list of records and has the last
+    record's sequence number as its id, so a reconnecting client (Last-Event-ID
+    or "since") resumes where it stopped; without either only new records are
+    sent. Records are batched into at most one event per "interval" seconds.
+    An "end" event closes the stream when the topic is unsubscribed. At most
+    SSE_MAX_STREAMS streams are open at once; further requests get a 503.
+    """
+    try:
+        broker = request.args.get('broker')
+        port = request.args.get('port', type=int)
+        topic = request.args.get('topic')
+        if not broker or port is None or not topic:
+            logging.error('Invalid query arguments. Expected "broker", "port" and "topic".')
+            return jsonify({'error': 'Invalid query arguments. Expected "broker", "port" and "topic".'}), 400
+        device = request.args.get('device') or None
+
+        try:
+            _, subscribed = subscribe_topic(broker, port, topic)
+        except Exception as e:
+            logging.error(f'An error occurred while connecting to MQTT broker: {str(e)}')
+            return jsonify({'error': f'An error occurred while connecting to MQTT broker: {str(e)}'}), 500
+        if not subscribed:
+            logging.error(f'Could not connect to MQTT broker {broker}:{port}')
+            return jsonify({'error': f'Could not connect to MQTT broker {broker}:{port}.', 'connected': False}), 502
+
+        since = request.headers.get('Last-Event-ID', request.args.get('since'), type=int)
+        if since is None:
+            since = mqtt_manager.sequence(broker, port, topic)
+        keepalive = app.config['SSE_KEEPALIVE']
+        # Clients may ask for slower batches ("interval" seconds), never faster ones.
+        min_interval = min(max(request.args.get('interval', 0, type=float), app.config['SSE_MIN_INTERVAL']), keepalive)
+
+        def events():
+            cursor = since
+            last_sent = time.monotonic()
+            while True:
+                result = mqtt_manager.wait_records(broker, port, topic, cursor, keepalive, device)
+                if result is None:
+                    yield 'event: end\ndata: {}\n\n'
+                    return
+                records, cursor = result
+                if records:
+                    yield f'id: {cursor}\nevent: records\ndata: {json.dumps(records)}\n\n'
+                    last_sent = time.monotonic()
+                    # Let fast topics accumulate so each event carries a batch.
+                    time.sleep(min_interval)
+                elif time.monotonic() - last_sent >= keepalive:
+                    # Comments keep proxies from closing the connection and reveal disconnected clients.
+                    yield ': keepalive\n\n'
+                    last_sent = time.monotonic()
+
+        if not acquire_stream():
+            logging.error(f"All {app.config['SSE_MAX_STREAMS']} event streams are in use.")
+            return jsonify({'error': 'Too many open event streams, try again later.'}), 503, {'Retry-After': '30'}
+        logging.info(f'Streaming topic {topic} from {broker}:{port} after record {since}')
+        response = app.response_class(events(), mimetype='text/event-stream',
+                                      headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        # Runs when the server closes the response, whether or not the stream ever started.
+        response.call_on_close(release_stream)
+        return response
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/timeseries', methods=['POST'])
+def timeseries():
+    """Stored samples of one topic/device: raw, or per-minute/per-hour buckets, optionally limited to [start, end] ms."""
+    try:
+        data = request.get_json()
+        if not data or not all(k in data for k in ('broker', 'port', 'topic')):
+            logging.error('Invalid JSON format. Expected "broker", "port" and "topic" keys.')
+            return jsonify({'error': 'Invalid JSON format. Expected "broker", "port" and "topic" keys.'}), 400
+
+        tier = data.get('tier', 'raw')
+        if tier not in TIERS:
+            logging.error(f'Invalid tier {tier}')
+            return jsonify({'error': f'Invalid tier. Expected one of {list(TIERS)}.'}), 400
+
+        store = mqtt_manager.store(data['broker'], data['port'])
+        columns = store.query(data['topic'], data.get('device'), tier, data.get('start'), data.get('end'),
+                              data.get('limit')) if store is not None else None
+        if columns is None:
+            return jsonify({'error': 'No samples stored for this topic and device.'}), 404
+
+        body = {'tier': tier,
+                'fields': columns.pop('fields'),
+                'devices': store.devices(data['topic']),
+                'score': [None if s != s else s for s in columns.pop('score').tolist()]}
+        body.update({name: column.tolist() for name, column in columns.items()})
+        return jsonify(body), 200
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/unsubscribe_mqtt_topic', methods=['POST'])
+def unsubscribe_mqtt_topic():
+    try:
+        data = request.get_json()
+        if not data or not all(k in data for k in ('broker', 'port', 'topic')):
+            logging.error('Invalid JSON format. Expected "broker", "port" and "topic" keys.')
+            return jsonify({'error': 'Invalid JSON format. Expected "broker", "port" and "topic" keys.'}), 400
+
+        if not mqtt_manager.unsubscribe(data['broker'], data['port'], data['topic']):
+            return jsonify({'error': 'Topic is not subscribed.'}), 404
+        return jsonify({'message': 'Successfully unsubscribed from the MQTT topic.'}), 200
+    except Exception as e:
+        logging.error(f'An error occurred: {str(e)}')
+        return jsonify({'error': str(e)}), 500
 
 
 if __name__ == '__main__':
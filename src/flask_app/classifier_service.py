@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+
+import numpy as np
+from joblib import load
+from sklearn.preprocessing import StandardScaler
+
+from forest_engine import FOREST_VERSION, ForestEngine, load_forest
+
+# Feature columns of models exported before bundles carried their own column order.
+X_COLUMNS = ['IAT', 'rst_count', 'urg_count', 'flow_duration', 'Variance', 'Duration', 'Header_Length', 'Number',
+             'Weight', 'Rate']
+BUNDLE_VERSION = 1
+
+
+class ModelBundle:
+    """A classifier with the feature order and scaler statistics it was trained with.
+
+    Bundles are written by training.export_bundle. Bare estimators from older
+    exports are wrapped too, but have no stored statistics, so each batch is
+    standardized on its own as before; that makes their predictions depend on
+    batch composition. Compact forests (training.export_compact) carry no
+    estimator at all and are always evaluated by the compiled engine.
+    """
+
+    # Up to this many rows the compiled engine beats sklearn's per-tree dispatch;
+    # above it sklearn's Cython traversal is faster (benchmarks/forest_engine_benchmark.py).
+    ENGINE_MAX_ROWS = 256
+
+    def __init__(self, model, columns, mean=None, scale=None, engine=None):
+        self.model = model
+        self.columns = list(columns)
+        self.mean = mean
+        self.scale = scale
+        # Compiled tree evaluator taking raw features (the scaler is folded into it).
+        self.engine = engine
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        obj = load(path, mmap_mode=mmap_mode)
+        if isinstance(obj, dict) and 'format_version' in obj:
+            if obj['format_version'] > BUNDLE_VERSION:
+                raise ValueError(f"{path} is bundle version {obj['format_version']}, "
+                                 f"this server reads up to {BUNDLE_VERSION}")
+            mean, scale = np.asarray(obj['mean']), np.asarray(obj['scale'])
+            if obj.get('forest', {}).get('format_version') == FOREST_VERSION:
+                engine = ForestEngine(obj['forest'])
+            elif hasattr(obj['model'], 'estimators_') or hasattr(obj['model'], 'tree_'):
+                # Bundles exported without a compiled forest, or with an older layout.
+                engine = ForestEngine.from_model(obj['model'], mean, scale)
+            else:
+                engine = None
+            return cls(obj['model'], obj['columns'], mean, scale, engine)
+        logging.warning(f'{path} is a bare estimator without scaler statistics; batches will be standardized individually')
+        return cls(obj, X_COLUMNS)
+
+    @classmethod
+    def load_compact(cls, directory, mmap_mode='r'):
+        arrays = load_forest(directory, mmap_mode=mmap_mode)
+        return cls(None, arrays['columns'], engine=ForestEngine(arrays))
+
+    def features(self, df):
+        missing = [c for c in self.columns if c not in df.columns]
+        if missing:
+            raise ValueError(f'Missing feature columns: {missing}')
+        return df[self.columns]
+
+    def transform(self, df):
+        # One owned float64 copy in training column order, standardized in place.
+        X = self.features(df).to_numpy(dtype=np.float64, copy=True)
+        if self.mean is None:
+            return StandardScaler().fit_transform(X)
+        X -= self.mean
+        X /= self.scale
+        return X
+
+    def predict(self, df):
+        if self.engine is not None and (self.model is None or len(df) <= self.ENGINE_MAX_ROWS):
+            return self.engine.predict(self.features(df).to_numpy(dtype=np.float64))
+        return self.model.predict(self.transform(df))
+
+
+def compact_path(path):
+    return os.path.splitext(path)[0] + '.forest'
+
+
+class TrafficClassifier:
+    """Process-wide holder of the traffic classifiers, loaded once and shared by every request.
+
+    With `mmap_mode='r'` the large node arrays of uncompressed joblib pickles are
+    memory-mapped instead of read into each process, so workers share them
+    through the page cache. A compact export next to a configured model,
+    e.g. `model.forest/` beside `model.joblib`, is loaded instead: it maps in
+    milliseconds and is a fraction of the size.
+    """
+
+    def __init__(self, model_paths, mmap_mode='r', batch_rows=100000):
+        self.model_paths = model_paths
+        self.mmap_mode = mmap_mode
+        self.batch_rows = batch_rows
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def model(self, name):
+        model = self.models.get(name)
+        if model is not None:
+            return model
+        with self.lock:
+            if name not in self.models:
+                path = self.model_paths[name]
+                compact = compact_path(path)
+                if os.path.isdir(compact):
+                    logging.info(f'Loading compact classifier {name} from {compact}')
+                    self.models[name] = ModelBundle.load_compact(compact, mmap_mode=self.mmap_mode)
+                else:
+                    logging.info(f'Loading classifier {name} from {path}')
+                    self.models[name] = ModelBundle.load(path, mmap_mode=self.mmap_mode)
+            return self.models[name]
+
+    def preload(self):
+        for name in self.model_paths:
+            self.model(name)
+
+    def available(self):
+        return {name: os.path.exists(path) or os.path.isdir(compact_path(path))
+                for name, path in self.model_paths.items()}
+
+    def classify(self, df):
+        predictions = {}
+        for name in self.model_paths:
+            bundle = self.model(name)
+            if bundle.mean is None and bundle.engine is None:
+                # Legacy models standardize per request, so the whole batch must be scaled together.
+                predictions[name] = bundle.predict(df).tolist()
+                continue
+            # Large uploads are predicted in slices to bound the per-tree probability buffers.
+            parts = [bundle.predict(df.iloc[start:start + self.batch_rows]) for start in range(0, len(df), self.batch_rows)]
+            predictions[name] = np.concatenate(parts).tolist() if parts else []
+        return predictions
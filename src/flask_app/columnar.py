@@ -0,0 +1,46 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+NPY_CONTENT_TYPE = 'application/x-npy'
+
+
+def array_from_npy(body):
+    """View an in-memory .npy payload as an array without copying its data."""
+    stream = io.BytesIO(body)
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    else:
+        raise ValueError(f'Unsupported .npy format version {version}')
+    if dtype.hasobject:
+        raise ValueError('Object arrays are not accepted.')
+    if len(shape) != 2:
+        raise ValueError('Expected a 2-D (rows, columns) array.')
+    count = int(np.prod(shape))
+    if len(body) - stream.tell() < count * dtype.itemsize:
+        raise ValueError('Truncated .npy payload.')
+    flat = np.frombuffer(body, dtype=dtype, count=count, offset=stream.tell())
+    return flat.reshape(shape, order='F' if fortran_order else 'C')
+
+
+def frame_from_npy(body, columns=None):
+    """Build a DataFrame over a (rows, columns) .npy payload.
+
+    Column-major (Fortran-order) payloads map onto pandas' column storage
+    directly, so the feature matrix is not copied.
+    """
+    X = array_from_npy(body)
+    if columns is not None and len(columns) != X.shape[1]:
+        raise ValueError(f'Got {len(columns)} column names for {X.shape[1]} columns.')
+    return pd.DataFrame(X, columns=columns, copy=False)
+
+
+def frame_to_npy(df, dtype='<f8'):
+    """Serialize a numeric DataFrame as a column-major .npy payload."""
+    buffer = io.BytesIO()
+    np.save(buffer, np.asfortranarray(df.to_numpy(dtype=dtype)), allow_pickle=False)
+    return buffer.getvalue()
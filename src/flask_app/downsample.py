@@ -0,0 +1,92 @@
+import numpy as np
+
+# Visual downsampling for charts: pick which rows of a long series to draw so
+# that a few thousand points look like the full series.
+
+
+def lttb(y, points, x=None):
+    """Largest-Triangle-Three-Buckets: indices of `points` rows that keep the shape of the line.
+
+    The first and last rows are always kept; every bucket in between
+    contributes the row forming the largest triangle with the previously
+    kept row and the mean of the next bucket. Budgets below three keep
+    only the endpoints.
+    """
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+    if points < 3:
+        return np.unique([0, n - 1])
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    # Mean of each bucket from prefix sums; the bucket after the last one is the final row.
+    cx = np.concatenate([[0.0], np.cumsum(x)])
+    cy = np.concatenate([[0.0], np.cumsum(y)])
+    sizes = edges[1:] - edges[:-1]
+    mean_x = np.append((cx[edges[1:]] - cx[edges[:-1]]) / sizes, x[-1])
+    mean_y = np.append((cy[edges[1:]] - cy[edges[:-1]]) / sizes, y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - mean_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(y, points):
+    """Indices of the minimum and maximum of each of points // 2 equal buckets, in row order."""
+    n = len(y)
+    buckets = max(points // 2, 1)
+    if points >= n:
+        return np.arange(n)
+    size = -(-n // buckets)
+    # Rounding the bucket size up can need fewer buckets; only the last one is padded, never all of it.
+    buckets = -(-n // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(-1, size)
+    offsets = np.arange(len(padded)) * size
+    return np.unique(np.concatenate([offsets + np.nanargmin(padded, axis=1),
+                                     offsets + np.nanargmax(padded, axis=1)]))
+
+
+METHODS = {'lttb': lttb, 'minmax': minmax}
+
+
+def downsample(y, points, method='lttb', keep=None):
+    """Rows to draw for `y`: the method's selection plus the rows in `keep` (e.g. anomalies), sorted."""
+    selected = METHODS[method](y, points)
+    if keep is not None and len(keep):
+        selected = np.union1d(selected, keep)
+    return selected
+
+
+def series_range(df, start=0, end=None, points=2000, method='lttb', score_column=None):
+    """Downsample rows [start, end) of every column of `df` for charting.
+
+    Rows whose score in `score_column` is negative are always kept, so
+    anomalies survive any zoom level; if there are more of them than
+    `points`, the lowest-scoring ones are kept.
+    """
+    end = len(df) if end is None else min(end, len(df))
+    start = max(0, min(start, end))
+    keep = None
+    result = {'start': start, 'end': end, 'rows': len(df), 'columns': {}}
+    if score_column is not None:
+        scores = df[score_column].to_numpy(dtype=np.float64)[start:end]
+        keep = np.flatnonzero(scores < 0)
+        if len(keep) > points:
+            keep = np.sort(keep[np.argpartition(scores[keep], points)[:points]])
+        result['anomalies'] = {'index': (keep + start).tolist(), 'score': scores[keep].tolist()}
+    for column in df.columns:
+        if column == score_column:
+            continue
+        y = df[column].to_numpy(dtype=np.float64)[start:end]
+        rows = downsample(y, points, method, keep)
+        result['columns'][str(column)] = {'index': (rows + start).tolist(), 'value': y[rows].tolist()}
+    return result
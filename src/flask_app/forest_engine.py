@@ -0,0 +1,213 @@
+import json
+import os
+
+import numpy as np
+
+FOREST_VERSION = 2
+ARRAYS = ('roots', 'feature', 'threshold', 'left', 'value')
+
+
+def _trees(model):
+    if hasattr(model, 'estimators_'):
+        return [est.tree_ for est in model.estimators_]
+    if hasattr(model, 'tree_'):
+        return [model.tree_]
+    raise ValueError(f'{type(model).__name__} is not a fitted tree classifier')
+
+
+def _breadth_first(tree, max_depth=None, min_samples=None):
+    """Node order in which the two children of every split are adjacent, which nodes split, and the depth.
+
+    Nodes at `max_depth` or holding fewer than `min_samples` training samples
+    become leaves; their subtrees are dropped.
+    """
+    left, right = tree.children_left, tree.children_right
+    order, splits, level, depth = [], [], np.array([0]), 0
+    while True:
+        split = left[level] != -1
+        if max_depth is not None and depth >= max_depth:
+            split[:] = False
+        if min_samples is not None:
+            split &= tree.n_node_samples[level] >= min_samples
+        order.append(level)
+        splits.append(split)
+        if not split.any():
+            return np.concatenate(order), np.concatenate(splits), depth
+        level = level[split]
+        level = np.column_stack([left[level], right[level]]).ravel()
+        depth += 1
+
+
+def compile_forest(model, mean=None, scale=None, max_depth=None, min_samples=None):
+    """Flatten a fitted decision tree or random forest classifier into contiguous node arrays.
+
+    All trees are concatenated, each renumbered breadth-first so that a split's
+    right child directly follows its left child: `left` holds the left child's
+    index into the shared arrays and `roots` each tree's first node. A leaf
+    stores -(leaf id + 1) in `left` instead, and `value` has one row per leaf
+    with its class probabilities already divided by the number of trees, so
+    summing the reached leaves gives the forest's predict_proba. When the
+    training scaler's `mean`/`scale` are passed they are folded into the
+    thresholds, x <= t * scale + mean, and the compiled forest takes raw
+    features. `max_depth` and `min_samples` prune the trees (see _breadth_first).
+    """
+    trees = _trees(model)
+    if trees[0].n_outputs != 1:
+        raise ValueError('Only single-output classifiers can be compiled')
+
+    feature, threshold, left, value, roots = [], [], [], [], []
+    offset = 0
+    n_leaves = 0
+    depth = 0
+    for tree in trees:
+        order, split, tree_depth = _breadth_first(tree, max_depth, min_samples)
+        position = np.empty(tree.node_count, dtype=np.int64)
+        position[order] = np.arange(len(order)) + offset
+        leaf_ids = n_leaves + np.cumsum(~split) - 1
+        f = np.where(split, tree.feature[order], 0)
+        thr = tree.threshold[order].astype(np.float64)
+        if mean is not None:
+            thr = thr * np.asarray(scale, dtype=np.float64)[f] + np.asarray(mean, dtype=np.float64)[f]
+
+        roots.append(offset)
+        feature.append(f)
+        threshold.append(np.where(split, thr, np.inf))
+        left.append(np.where(split, position[np.where(split, tree.children_left[order], 0)], -(leaf_ids + 1)))
+        counts = tree.value[order[~split], 0, :]
+        totals = counts.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1.0
+        value.append(counts / totals / len(trees))
+        depth = max(depth, tree_depth)
+        offset += len(order)
+        n_leaves += int((~split).sum())
+
+    return {'format_version': FOREST_VERSION,
+            'n_features': int(model.n_features_in_),
+            'classes': np.asarray(model.classes_),
+            'max_depth': int(depth),
+            'roots': np.asarray(roots, dtype=np.int64),
+            'feature': np.concatenate(feature).astype(np.int32),
+            'threshold': np.concatenate(threshold),
+            'left': np.concatenate(left).astype(np.int64),
+            'value': np.concatenate(value)}
+
+
+def compact_forest(arrays):
+    """Shrink a compiled forest: float32 thresholds and leaf values, the smallest integer types for indices.
+
+    Node indices use int16 when the whole forest fits, int32 otherwise, and
+    feature indices int16. Rounding the thresholds to float32 can only change
+    a decision for values within float32 precision of a threshold.
+    """
+    n_nodes = len(arrays['left'])
+    n_leaves = len(arrays['value'])
+    index_dtype = np.int16 if max(n_nodes, n_leaves) < np.iinfo(np.int16).max else np.int32
+    compact = dict(arrays)
+    compact['roots'] = arrays['roots'].astype(index_dtype)
+    compact['left'] = arrays['left'].astype(index_dtype)
+    compact['feature'] = arrays['feature'].astype(np.int16)
+    compact['threshold'] = arrays['threshold'].astype(np.float32)
+    compact['value'] = arrays['value'].astype(np.float32)
+    return compact
+
+
+def save_forest(arrays, directory, **meta):
+    """Write a compiled forest as one .npy file per array plus meta.json (written last).
+
+    Extra keyword arguments, e.g. the feature `columns`, are stored in meta.json.
+    """
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    for name in ARRAYS:
+        np.save(os.path.join(directory, f'{name}.npy'), arrays[name])
+    meta = {'format_version': arrays['format_version'],
+            'n_features': arrays['n_features'],
+            'classes': arrays['classes'].tolist(),
+            'max_depth': arrays['max_depth'],
+            **meta}
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def load_forest(directory, mmap_mode='r'):
+    """Read a forest written by save_forest; with mmap_mode='r' this only maps the files."""
+    with open(os.path.join(directory, 'meta.json')) as f:
+        arrays = json.load(f)
+    arrays['classes'] = np.asarray(arrays['classes'])
+    for name in ARRAYS:
+        arrays[name] = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+    return arrays
+
+
+class ForestEngine:
+    """Batched evaluator for compiled forests.
+
+    Instead of walking one tree at a time, every (tree, row) pair advances one
+    level per step with three vectorized gathers (left child, feature,
+    threshold); the next node is left + not(x <= threshold), and pairs that reach
+    a leaf are dropped from the active set. Rows are processed in slices of
+    `batch_rows` to bound the trees x rows index arrays.
+    """
+
+    def __init__(self, arrays, batch_rows=20000):
+        if arrays.get('format_version') != FOREST_VERSION:
+            raise ValueError(f"Compiled forest version {arrays.get('format_version')} is not {FOREST_VERSION}")
+        self.arrays = arrays
+        self.batch_rows = batch_rows
+        self.classes = np.asarray(arrays['classes'])
+        self.n_features = arrays['n_features']
+        self.roots = np.asarray(arrays['roots'])
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.value = arrays['value']
+
+    @classmethod
+    def from_model(cls, model, mean=None, scale=None, max_depth=None, min_samples=None, **kwargs):
+        return cls(compile_forest(model, mean, scale, max_depth, min_samples), **kwargs)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r', **kwargs):
+        return cls(load_forest(directory, mmap_mode), **kwargs)
+
+    def save(self, directory, **meta):
+        save_forest(self.arrays, directory, **meta)
+
+    def _leaves(self, X):
+        """Leaf id reached in every tree by every row, shape (n_trees, rows)."""
+        n, n_features = X.shape
+        n_trees = len(self.roots)
+        flat = X.ravel()
+        leaves = np.empty(n_trees * n, dtype=np.int64)
+        nodes = np.repeat(self.roots.astype(np.int64), n)
+        pos = np.arange(n_trees * n)
+        # Offset of each pair's row in the flattened batch.
+        offsets = np.tile(np.arange(n) * n_features, n_trees)
+        while pos.size:
+            left = self.left[nodes]
+            done = left < 0
+            if done.any():
+                leaves[pos[done]] = -1 - left[done]
+                keep = ~done
+                pos, nodes, offsets, left = pos[keep], nodes[keep], offsets[keep], left[keep]
+            # Written as not(x <= t) so that NaN goes right.
+            nodes = left + ~(flat[offsets + self.feature[nodes]] <= self.threshold[nodes])
+        return leaves.reshape(n_trees, n)
+
+    def predict_proba(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f'Expected {self.n_features} features, got shape {X.shape}')
+        proba = np.zeros((X.shape[0], len(self.classes)))
+        for start in range(0, X.shape[0], self.batch_rows):
+            leaves = self._leaves(X[start:start + self.batch_rows])
+            out = proba[start:start + self.batch_rows]
+            for tree_leaves in leaves:
+                out += self.value[tree_leaves]
+        return proba
+
+    def predict(self, X):
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1))
@@ -0,0 +1,75 @@
+"""gunicorn settings for serving backend.py in production.
+
+Usage (from src/flask_app/):
+    gunicorn
+
+gunicorn reads this file from the working directory. Every setting can be
+overridden on the command line (e.g. `gunicorn --workers 4`) or through the
+environment variables below.
+
+Each worker is a process with its own threads. The app is imported and the
+classifier models loaded once in the master, before the workers are forked,
+so the workers share those pages copy-on-write.
+
+MQTT subscriptions, fitted models, jobs and chart series live in the memory
+of the worker that created them, so the default is one worker with many
+threads. More workers only help stateless endpoints (/login,
+/detect_anomalies, /classify_traffic), unless a proxy pins each client to
+one worker.
+
+Every open /stream_mqtt connection holds one thread for as long as it
+lasts, so at most DASHBOARD_SSE_STREAMS of a worker's threads may serve
+streams (half of them by default). Further streams get a 503, and the other threads stay
+free for regular requests. Requests cannot be interrupted once they run,
+so the backend bounds their work instead: frames longer than SYNC_MAX_ROWS
+(see backend.py) are refused with a 413 and belong in /jobs.
+"""
+import gc
+import os
+import signal
+import threading
+
+wsgi_app = 'backend:app'
+bind = os.environ.get('DASHBOARD_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('DASHBOARD_WORKERS', 1))
+# Threads rather than sync workers: event streams hold their connection open.
+worker_class = 'gthread'
+threads = int(os.environ.get('DASHBOARD_THREADS', 16))
+preload_app = True
+
+# Seconds a worker may go without checking in before the master kills and replaces it.
+timeout = int(os.environ.get('DASHBOARD_TIMEOUT', 120))
+# Seconds a stopping worker gets to finish its requests, after which they are cut off.
+graceful_timeout = int(os.environ.get('DASHBOARD_GRACEFUL_TIMEOUT', 30))
+# Seconds an idle keep-alive connection is kept open.
+keepalive = 5
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any worker is forked.
+    import backend
+    streams = int(os.environ.get('DASHBOARD_SSE_STREAMS', server.cfg.threads // 2))
+    backend.app.config['SSE_MAX_STREAMS'] = max(0, min(streams, server.cfg.threads - 1))
+    backend.preload()
+    # Keep the garbage collector from touching, and so copying, the preloaded objects in every worker.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import backend
+    # SQLite connections must not be shared with the master; the worker opens its own.
+    with backend.app.app_context():
+        backend.db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    # On SIGTERM gunicorn stops accepting and waits for open requests, but event streams
+    # never finish on their own: end them, cancel jobs and flush alerts while it waits.
+    import backend
+    handle_exit = worker.handle_exit
+
+    def drain(sig, frame):
+        handle_exit(sig, frame)
+        threading.Thread(target=backend.shutdown, args=(graceful_timeout,), daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain)
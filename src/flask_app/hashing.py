@@ -0,0 +1,27 @@
+import hashlib
+import json
+
+import numpy as np
+
+
+def frame_digest(df):
+    """Content hash of a DataFrame's column names, dtypes and values."""
+    h = hashlib.sha256()
+    for column in df.columns:
+        values = df[column].to_numpy()
+        h.update(str(column).encode())
+        h.update(str(values.dtype).encode())
+        if values.dtype == object:
+            h.update(json.dumps(values.tolist(), default=str).encode())
+        else:
+            h.update(np.ascontiguousarray(values).tobytes())
+    return h.hexdigest()
+
+
+def request_key(df, algorithm, parameters):
+    """Key identifying one (dataset, algorithm, parameters) combination."""
+    h = hashlib.sha256()
+    h.update(frame_digest(df).encode())
+    h.update(str(algorithm).encode())
+    h.update(json.dumps(parameters or {}, sort_keys=True, default=str).encode())
+    return h.hexdigest()
@@ -0,0 +1,184 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from algorithms.dbscan import detect_anomalies_dbscan
+from model_registry import ALGORITHMS
+
+PENDING, RUNNING, FINISHED, FAILED, CANCELLED = 'pending', 'running', 'finished', 'failed', 'cancelled'
+
+
+# Worker-side steps. They live at module level so the process pool can pickle them.
+
+def _fit(df, algorithm, parameters):
+    return ALGORITHMS[algorithm][0](df, **parameters)
+
+def _score(algorithm, scaler, estimator, df):
+    return np.asarray(ALGORITHMS[algorithm][1](scaler, estimator, df))
+
+def _dbscan(df, parameters):
+    labels = detect_anomalies_dbscan(df, **parameters)
+    if labels is None:
+        raise RuntimeError('An error occurred while detecting anomalies.')
+    return np.asarray(labels)
+
+
+class Job:
+    def __init__(self, algorithm, parameters, rows, user=None):
+        self.id = uuid.uuid4().hex
+        self.algorithm = algorithm
+        self.parameters = parameters
+        self.rows = rows
+        self.user = user
+        self.status = PENDING
+        self.progress = 0.0
+        self.error = None
+        self.result = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.futures = []
+        self.cancel_requested = False
+
+    def to_dict(self):
+        return {'job_id': self.id,
+                'algorithm': self.algorithm,
+                'rows': self.rows,
+                'status': self.status,
+                'progress': round(self.progress, 4),
+                'error': self.error,
+                'submitted_at': self.submitted_at,
+                'finished_at': self.finished_at}
+
+
+class JobManager:
+    """Runs detections on a process pool and keeps their state for polling.
+
+    Isolation Forest and SVM jobs are split into one fit step plus one scoring
+    step per `chunk_rows` rows, which gives progress and lets the scoring run on
+    several cores. DBSCAN labels depend on the whole dataset and runs as a
+    single step. Finished jobs are kept up to `max_finished` jobs and
+    `max_result_bytes` of results, oldest first out. `on_finished(job)` is
+    called with every job that finishes successfully.
+    """
+
+    def __init__(self, max_workers=None, chunk_rows=50000, max_finished=100, max_result_bytes=256 * 1024 * 1024,
+                 on_finished=None):
+        self.max_workers = max_workers or os.cpu_count()
+        self.chunk_rows = chunk_rows
+        self.max_finished = max_finished
+        self.max_result_bytes = max_result_bytes
+        self.on_finished = on_finished
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def _pool(self):
+        # Created on first use so no worker processes exist before the server forks. Workers
+        # come from a forkserver, not a fork of this multi-threaded process, so they never
+        # inherit locks held by other threads or the server's sockets and database handles.
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                    mp_context=multiprocessing.get_context('forkserver'))
+            return self.executor
+
+    def submit(self, df, algorithm, parameters=None, user=None):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f'Invalid algorithm specified: {algorithm}')
+        job = Job(algorithm, parameters or {}, len(df), user)
+        with self.lock:
+            self.jobs[job.id] = job
+        threading.Thread(target=self._run, args=(job, df), daemon=True).start()
+        return job
+
+    def _run(self, job, df):
+        pool = self._pool()
+        try:
+            if job.cancel_requested:
+                raise CancelledError()
+            job.status = RUNNING
+            if job.algorithm == 'DBSCAN':
+                job.futures = [pool.submit(_dbscan, df, job.parameters)]
+                result = job.futures[0].result()
+            else:
+                job.futures = [pool.submit(_fit, df, job.algorithm, job.parameters)]
+                scaler, estimator = job.futures[0].result()
+                starts = range(0, len(df), self.chunk_rows)
+                steps = len(starts) + 1
+                job.progress = 1 / steps
+                if job.cancel_requested:
+                    raise CancelledError()
+                chunks = {pool.submit(_score, job.algorithm, scaler, estimator, df.iloc[start:start + self.chunk_rows]): i
+                          for i, start in enumerate(starts)}
+                job.futures = list(chunks)
+                parts = [None] * len(chunks)
+                for done, future in enumerate(as_completed(chunks), start=2):
+                    parts[chunks[future]] = future.result()
+                    job.progress = done / steps
+                result = np.concatenate(parts) if parts else np.empty(0)
+            if job.cancel_requested:
+                raise CancelledError()
+            job.result = result
+            job.progress = 1.0
+            job.status = FINISHED
+        except CancelledError:
+            job.status = CANCELLED
+        except Exception as e:
+            logging.error(f'Job {job.id} failed: {str(e)}')
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            if job.cancel_requested:
+                job.status = CANCELLED
+                job.result = None
+            job.futures = []
+            job.finished_at = time.time()
+            self._trim()
+        if job.status == FINISHED and self.on_finished is not None:
+            try:
+                self.on_finished(job)
+            except Exception as e:
+                logging.error(f'Job {job.id} completion hook failed: {str(e)}')
+
+    def _trim(self):
+        with self.lock:
+            finished = [j for j in self.jobs.values() if j.finished_at is not None]
+            result_bytes = sum(j.result.nbytes for j in finished if j.result is not None)
+            while finished and (len(finished) > self.max_finished or result_bytes > self.max_result_bytes):
+                oldest = finished.pop(0)
+                if oldest.result is not None:
+                    result_bytes -= oldest.result.nbytes
+                del self.jobs[oldest.id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job.finished_at is None:
+            job.cancel_requested = True
+            job.status = CANCELLED
+            # Steps already running in a worker finish, but their output is discarded.
+            for future in list(job.futures):
+                future.cancel()
+        return job
+
+    def list(self):
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def shutdown(self, wait=True):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
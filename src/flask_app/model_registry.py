@@ -0,0 +1,123 @@
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from joblib import dump, load
+
+from algorithms.dbscan import fit_dbscan, score_dbscan
+from algorithms.isolation_forest import fit_iforest, score_iforest
+from algorithms.svm import fit_svm, score_svm
+from hashing import request_key
+
+# algorithm name -> (fit(df, **parameters) -> (scaler, estimator), score(scaler, estimator, df) -> array)
+ALGORITHMS = {
+    'isolation_forest': (fit_iforest, score_iforest),
+    'SVM': (fit_svm, score_svm),
+    'DBSCAN': (fit_dbscan, score_dbscan),
+}
+
+# Model IDs are request_key digests; anything else is never looked up on disk.
+MODEL_ID = re.compile(r'[0-9a-f]{64}')
+
+
+class StoredModel:
+    def __init__(self, algorithm, parameters, columns, scaler, estimator):
+        self.algorithm = algorithm
+        self.parameters = parameters
+        self.columns = columns
+        self.scaler = scaler
+        self.estimator = estimator
+
+    def score(self, df):
+        missing = [c for c in self.columns if c not in df.columns]
+        if missing:
+            raise ValueError(f'Missing feature columns: {missing}')
+        score = ALGORITHMS[self.algorithm][1]
+        return score(self.scaler, self.estimator, df[self.columns])
+
+
+class ModelRegistry:
+    """LRU store of fitted (scaler, estimator) pairs keyed by a hash of data, algorithm and parameters.
+
+    Fitting the same dataset with the same parameters twice returns the existing
+    model ID. With `persist_dir` set, models are also dumped with joblib so they
+    survive eviction and restarts; at most `disk_capacity` files are kept
+    there, and the least recently used ones are deleted first.
+    """
+
+    def __init__(self, capacity=16, persist_dir=None, disk_capacity=256):
+        self.capacity = capacity
+        self.persist_dir = persist_dir
+        self.disk_capacity = disk_capacity
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+        # Held while pruning, so two fits never delete the same files.
+        self.disk_lock = threading.Lock()
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+            self._prune_disk()
+
+    def _path(self, model_id):
+        return os.path.join(self.persist_dir, f'{model_id}.joblib')
+
+    def _prune_disk(self):
+        # File modification times record the last use; models still in memory go last.
+        if self.disk_capacity is None:
+            return
+        with self.disk_lock:
+            paths = [os.path.join(self.persist_dir, name) for name in os.listdir(self.persist_dir)
+                     if name.endswith('.joblib')]
+            if len(paths) <= self.disk_capacity:
+                return
+            with self.lock:
+                loaded = {self._path(model_id) for model_id in self.models}
+            paths.sort(key=lambda path: (path in loaded, os.path.getmtime(path)))
+            for path in paths[:len(paths) - self.disk_capacity]:
+                os.remove(path)
+                logging.info(f'Deleted stored model {path}')
+
+    def _put(self, model_id, model):
+        with self.lock:
+            self.models[model_id] = model
+            self.models.move_to_end(model_id)
+            while len(self.models) > self.capacity:
+                evicted, _ = self.models.popitem(last=False)
+                logging.info(f'Evicted model {evicted} from the registry')
+
+    def get(self, model_id):
+        if not isinstance(model_id, str) or not MODEL_ID.fullmatch(model_id):
+            return None
+        with self.lock:
+            model = self.models.get(model_id)
+            if model is not None:
+                self.models.move_to_end(model_id)
+                return model
+        if self.persist_dir and os.path.exists(self._path(model_id)):
+            model = load(self._path(model_id))
+            os.utime(self._path(model_id))
+            self._put(model_id, model)
+            return model
+        return None
+
+    def fit(self, df, algorithm, parameters=None):
+        """Fit and store a model, returning (model_id, created)."""
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f'Invalid algorithm specified: {algorithm}')
+        parameters = parameters or {}
+        model_id = request_key(df, algorithm, parameters)
+        if self.get(model_id) is not None:
+            return model_id, False
+
+        fit = ALGORITHMS[algorithm][0]
+        scaler, estimator = fit(df, **parameters)
+        model = StoredModel(algorithm, parameters, list(df.columns), scaler, estimator)
+        self._put(model_id, model)
+        if self.persist_dir:
+            dump(model, self._path(model_id))
+            self._prune_disk()
+        return model_id, True
+
+    def __len__(self):
+        return len(self.models)
@@ -0,0 +1,373 @@
+import copy
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+import paho.mqtt.client as mqtt
+
+from algorithms.streaming import extract_records
+from timeseries_store import TimeSeriesStore
+
+
+class TopicBuffer:
+    """Bounded ring buffer holding the most recent messages of one topic.
+
+    Parsed records also get a per-topic sequence number, so push clients can
+    ask for everything after the last record they saw. At most
+    `max_detectors` per-device detectors are kept; the least recently used
+    one is dropped to make room, and that device starts over if it returns.
+    """
+
+    def __init__(self, maxlen, max_detectors=1000):
+        self.max_detectors = max_detectors
+        self.messages = deque(maxlen=maxlen)
+        self.scores = deque(maxlen=maxlen)
+        self.records = deque(maxlen=maxlen)
+        self.sequence = 0
+        self.received = 0
+        # (template, per-device copies, features), replaced as one tuple so a
+        # message being scored never mixes the old and the new detector.
+        self.detection = (None, OrderedDict(), None)
+
+    def append(self, message):
+        self.messages.append(message)
+        self.received += 1
+
+    @property
+    def detector(self):
+        return self.detection[0]
+
+    def set_detector(self, detector, features=None):
+        # `detector` is a fresh template; every device gets its own copy so
+        # interleaved devices do not share window or model state.
+        self.detection = (detector, OrderedDict(), features)
+        self.scores.clear()
+
+    def score(self, message, topic=None):
+        """Parse every record carried by `message` and run the device's streaming detector on it.
+
+        Records are returned even without a detector (score None) so they can
+        be stored; `anomaly` is only set from a score. Detectors are kept per
+        (topic, device), so the topics matched by one wildcard subscription
+        are scored separately.
+        """
+        template, detectors, features = self.detection
+        results = []
+        for timestamp, device, fields, values in extract_records(message['message'], features):
+            score = None
+            if template is not None:
+                detector = detectors.get((topic, device))
+                if detector is None:
+                    detector = detectors[(topic, device)] = copy.deepcopy(template)
+                    if len(detectors) > self.max_detectors:
+                        detectors.popitem(last=False)
+                else:
+                    detectors.move_to_end((topic, device))
+                try:
+                    score = detector.score(values)
+                except Exception as e:
+                    logging.warning(f'Streaming detector failed on record {values}: {str(e)}')
+                    continue
+            results.append({'received_at': message['received_at'],
+                            'timestamp': timestamp,
+                            'device': device,
+                            'fields': fields,
+                            'values': values,
+                            'score': score,
+                            'anomaly': score is not None and score < 0})
+        return results
+
+    def publish(self, records):
+        for record in records:
+            self.sequence += 1
+            record['seq'] = self.sequence
+        self.records.extend(records)
+        if self.detector is not None:
+            self.scores.extend(records)
+
+    def records_since(self, sequence, device=None):
+        """Buffered records numbered after `sequence`, optionally of one device, oldest first."""
+        # Walk from the right end so the cost depends on the number of new records.
+        newer = []
+        for record in reversed(self.records):
+            if record['seq'] <= sequence:
+                break
+            if device is None or record['device'] == device:
+                newer.append(record)
+        newer.reverse()
+        return newer
+
+    def latest_scores(self, limit=None):
+        if limit is None or limit >= len(self.scores):
+            return list(self.scores)
+        if limit <= 0:
+            return []
+        return [self.scores[-i] for i in range(limit, 0, -1)]
+
+    def latest(self, limit=None):
+        if limit is None or limit >= len(self.messages):
+            return list(self.messages)
+        if limit <= 0:
+            return []
+        # Walk from the right end so the cost depends on `limit`, not on the buffer size.
+        return [self.messages[-i] for i in range(limit, 0, -1)]
+
+
+class BrokerConnection:
+    """One long-lived MQTT client multiplexing every topic subscribed on a broker.
+
+    Topics may be filters with + and # wildcards; every message goes to each
+    subscription whose filter matches its topic. Samples are scored once,
+    then stored and alerted on under the message's own topic.
+    """
+
+    def __init__(self, broker, port, buffer_size, store, on_records=None, keepalive=60, max_detectors=1000):
+        self.broker = broker
+        self.port = port
+        self.buffer_size = buffer_size
+        self.max_detectors = max_detectors
+        self.store = store
+        self.on_records = on_records
+        self.topics = {}
+        self.lock = threading.Lock()
+        # Notified whenever records are published or a topic goes away.
+        self.updated = threading.Condition(self.lock)
+        # Set while the broker connection is up.
+        self.connected = threading.Event()
+
+        self.client = mqtt.Client()
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+        self.client.connect_async(broker, port, keepalive)
+        self.client.loop_start()
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            logging.info(f'Connected to MQTT broker {self.broker}:{self.port}')
+            self.connected.set()
+            # Subscriptions are lost on reconnect, so restore them all.
+            with self.lock:
+                topics = list(self.topics)
+            for topic in topics:
+                client.subscribe(topic)
+        else:
+            logging.error(f'Connection to MQTT broker {self.broker}:{self.port} failed with result code {rc}')
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+        if rc != 0:
+            logging.warning(f'Unexpected disconnect from MQTT broker {self.broker}:{self.port} (rc={rc})')
+
+    def on_message(self, client, userdata, msg):
+        payload = msg.payload.decode('utf-8', errors='replace')
+        if not payload:
+            return
+        try:
+            message = json.loads(payload)
+        except json.JSONDecodeError:
+            logging.warning(f'Failed to parse payload on topic {msg.topic} as JSON.')
+            return
+        entry = {'received_at': time.time(), 'message': message}
+        with self.lock:
+            buffers = [buffer for topic, buffer in self.topics.items() if mqtt.topic_matches_sub(topic, msg.topic)]
+            for buffer in buffers:
+                buffer.append(entry)
+        if not buffers:
+            return
+        # The sample is scored, stored and alerted on once, by a matching subscription with a
+        # detector if any; every matching subscription then gets its own copy of those records.
+        scorer = min(buffers, key=lambda buffer: buffer.detector is None)
+        # Scoring runs on this connection's network thread, outside the lock,
+        # so readers of other topics are never blocked behind a model.
+        records = scorer.score(entry, msg.topic)
+        if not records:
+            return
+        received_ms = int(entry['received_at'] * 1000)
+        for record in records:
+            record['topic'] = msg.topic
+            self.store.append(msg.topic, record['device'], record['fields'], received_ms,
+                              record['values'], record['score'])
+        with self.lock:
+            for buffer in buffers:
+                buffer.publish([dict(record) for record in records])
+            self.updated.notify_all()
+        if self.on_records is not None and scorer.detector is not None:
+            self.on_records(msg.topic, records)
+
+    def subscribe(self, topic):
+        """Returns the topic's buffer and whether this call created it."""
+        with self.lock:
+            buffer = self.topics.get(topic)
+            if buffer is not None:
+                return buffer, False
+            buffer = self.topics[topic] = TopicBuffer(self.buffer_size, self.max_detectors)
+        if self.connected.is_set():
+            self.client.subscribe(topic)
+        return buffer, True
+
+    def unsubscribe(self, topic):
+        with self.lock:
+            removed = self.topics.pop(topic, None)
+            remaining = list(self.topics)
+            self.updated.notify_all()
+        if removed is not None:
+            # Drop the samples of every topic this filter matched that no remaining subscription covers.
+            for stored in self.store.topics():
+                if mqtt.topic_matches_sub(topic, stored) and \
+                        not any(mqtt.topic_matches_sub(other, stored) for other in remaining):
+                    self.store.remove(stored)
+            if self.connected.is_set():
+                self.client.unsubscribe(topic)
+        return removed is not None
+
+    def idle(self):
+        with self.lock:
+            return not self.topics
+
+    def latest(self, topic, limit=None):
+        with self.lock:
+            buffer = self.topics.get(topic)
+            if buffer is None:
+                return [], 0
+            return buffer.latest(limit), buffer.received
+
+    def latest_scores(self, topic, limit=None):
+        with self.lock:
+            buffer = self.topics.get(topic)
+            if buffer is None:
+                return []
+            return buffer.latest_scores(limit)
+
+    def sequence(self, topic):
+        with self.lock:
+            buffer = self.topics.get(topic)
+            return buffer.sequence if buffer is not None else 0
+
+    def wait_records(self, topic, sequence, timeout, device=None):
+        """Block until records numbered after `sequence` arrive or `timeout` seconds pass.
+
+        Returns (records, latest sequence number), or None once the topic is
+        unsubscribed. The records can be empty after a timeout or when only
+        other devices published.
+        """
+        with self.updated:
+            buffer = self.topics.get(topic)
+            if buffer is None:
+                return None
+            self.updated.wait_for(lambda: buffer.sequence > sequence or self.topics.get(topic) is not buffer, timeout)
+            if self.topics.get(topic) is not buffer:
+                return None
+            return buffer.records_since(sequence, device), buffer.sequence
+
+    def attach_detector(self, topic, detector, features=None):
+        buffer, _ = self.subscribe(topic)
+        with self.lock:
+            buffer.set_detector(detector, features)
+
+    def close(self):
+        # Waiting streams see their topics go away and end.
+        with self.updated:
+            self.topics.clear()
+            self.updated.notify_all()
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class MQTTSubscriberManager:
+    """Pool of broker connections, one per (broker, port), shared by every request.
+
+    Each connection records its topics' samples in its own TimeSeriesStore,
+    built by `store_factory`. `on_records(topic, records)` is called on the
+    network thread with every batch of scored records. A connection is
+    closed once its last topic is unsubscribed.
+    """
+
+    def __init__(self, buffer_size=1000, store_factory=TimeSeriesStore, on_records=None, max_detectors=1000):
+        self.buffer_size = buffer_size
+        self.max_detectors = max_detectors
+        self.store_factory = store_factory
+        self.on_records = on_records
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def _connection(self, broker, port):
+        # Callers hold self.lock, so a connection cannot be dropped between lookup and use.
+        key = (broker, int(port))
+        conn = self.connections.get(key)
+        if conn is None:
+            conn = self.connections[key] = BrokerConnection(broker, int(port), self.buffer_size,
+                                                            self.store_factory(), self.on_records,
+                                                            max_detectors=self.max_detectors)
+        return conn
+
+    def subscribe(self, broker, port, topic):
+        """Subscribe to `topic`, connecting to the broker if needed; returns True if it was not subscribed yet."""
+        with self.lock:
+            _, created = self._connection(broker, port).subscribe(topic)
+        return created
+
+    def unsubscribe(self, broker, port, topic):
+        key = (broker, int(port))
+        with self.lock:
+            conn = self.connections.get(key)
+            if conn is None:
+                return False
+            removed = conn.unsubscribe(topic)
+            if conn.idle():
+                del self.connections[key]
+            else:
+                conn = None
+        if conn is not None:
+            conn.close()
+        return removed
+
+    def wait_connected(self, broker, port, timeout):
+        """Wait up to `timeout` seconds for the broker connection; returns whether it is up."""
+        with self.lock:
+            conn = self.connections.get((broker, int(port)))
+        return conn is not None and conn.connected.wait(timeout)
+
+    def latest(self, broker, port, topic, limit=None):
+        with self.lock:
+            conn = self.connections.get((broker, int(port)))
+        if conn is None:
+            return [], 0
+        return conn.latest(topic, limit)
+
+    def latest_scores(self, broker, port, topic, limit=None):
+        with self.lock:
+            conn = self.connections.get((broker, int(port)))
+        if conn is None:
+            return []
+        return conn.latest_scores(topic, limit)
+
+    def attach_detector(self, broker, port, topic, detector, features=None):
+        with self.lock:
+            self._connection(broker, port).attach_detector(topic, detector, features)
+
+    def sequence(self, broker, port, topic):
+        with self.lock:
+            conn = self.connections.get((broker, int(port)))
+        return conn.sequence(topic) if conn is not None else 0
+
+    def wait_records(self, broker, port, topic, sequence, timeout, device=None):
+        with self.lock:
+            conn = self.connections.get((broker, int(port)))
+        if conn is None:
+            return None
+        return conn.wait_records(topic, sequence, timeout, device)
+
+    def store(self, broker, port):
+        with self.lock:
+            conn = self.connections.get((broker, int(port)))
+        return conn.store if conn is not None else None
+
+    def close(self):
+        with self.lock:
+            connections = list(self.connections.values())
+            self.connections.clear()
+        for conn in connections:
+            conn.close()
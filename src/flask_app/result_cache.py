@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """LRU cache of serialized responses bounded by total size and entry age.
+
+    Values are stored as bytes so a hit can be returned without re-encoding,
+    and their length is what counts against `max_bytes`. With `sliding`,
+    every hit restarts the entry's `ttl`, so it expires after its last use
+    rather than after it was stored.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=600, sliding=False):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sliding = sliding
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def _remove(self, key):
+        value, _ = self.entries.pop(key)
+        self.size -= len(value)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if self.ttl is not None and expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            if self.sliding and self.ttl is not None:
+                self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return False
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, expires)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'evictions': self.evictions,
+                    'entries': len(self.entries),
+                    'bytes': self.size,
+                    'max_bytes': self.max_bytes,
+                    'ttl': self.ttl}
@@ -0,0 +1,201 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Tier name -> bucket length in seconds; 'raw' keeps every sample.
+TIERS = {'raw': None, '1min': 60, '1hour': 3600}
+
+
+class RingColumns:
+    """Fixed-capacity ring of named NumPy columns that always reads back as contiguous slices.
+
+    Every row is written twice, at i and i + alloc, so the live rows
+    [first, first + count) never wrap and any range of them is a view.
+    Storage starts at `initial` rows and doubles up to `capacity`; once full,
+    each append overwrites the oldest row.
+    """
+
+    def __init__(self, capacity, columns, initial=1024):
+        self.capacity = capacity
+        self.columns = columns  # name -> (dtype, width or None)
+        self.alloc = min(initial, capacity)
+        self.arrays = {name: self._empty(dtype, width, self.alloc) for name, (dtype, width) in columns.items()}
+        self.first = 0
+        self.count = 0
+
+    @staticmethod
+    def _empty(dtype, width, alloc):
+        shape = (2 * alloc,) if width is None else (2 * alloc, width)
+        return np.empty(shape, dtype=dtype)
+
+    def _grow(self):
+        alloc = min(2 * self.alloc, self.capacity)
+        for name, (dtype, width) in self.columns.items():
+            old = self.arrays[name][self.first:self.first + self.count]
+            new = self._empty(dtype, width, alloc)
+            new[:self.count] = old
+            new[alloc:alloc + self.count] = old
+            self.arrays[name] = new
+        self.alloc = alloc
+        self.first = 0
+
+    def append(self, row):
+        if self.count == self.alloc and self.alloc < self.capacity:
+            self._grow()
+        if self.count == self.alloc:
+            i = self.first
+            self.first = (self.first + 1) % self.alloc
+        else:
+            i = (self.first + self.count) % self.alloc
+            self.count += 1
+        for name, array in self.arrays.items():
+            array[i] = array[i + self.alloc] = row[name]
+
+    def drop(self, n):
+        """Forget the `n` oldest rows."""
+        n = min(n, self.count)
+        self.first = (self.first + n) % self.alloc
+        self.count -= n
+
+    def view(self, name, lo=0, hi=None):
+        hi = self.count if hi is None else hi
+        return self.arrays[name][self.first + lo:self.first + hi]
+
+
+class Series:
+    """All samples of one topic/device: a raw tier plus bucketed tiers.
+
+    Timestamps are int64 milliseconds and kept non-decreasing, values float32
+    with one column per field, and `score` holds the streaming detector's
+    score (NaN without one). Bucketed tiers store the count, mean, min and max
+    of every closed bucket and the lowest score seen in it, so a single
+    anomalous sample is still visible in the hourly view. Raw samples older
+    than `max_age` seconds are dropped as new ones arrive.
+    """
+
+    def __init__(self, fields, capacities, max_age=None):
+        self.fields = list(fields)
+        width = len(self.fields)
+        self.max_age = max_age
+        self.last = None
+        self.tiers = {}
+        self.buckets = {}
+        for tier, seconds in TIERS.items():
+            if seconds is None:
+                columns = {'timestamp': (np.int64, None), 'values': (np.float32, width), 'score': (np.float32, None)}
+            else:
+                columns = {'timestamp': (np.int64, None), 'count': (np.int32, None), 'mean': (np.float32, width),
+                           'min': (np.float32, width), 'max': (np.float32, width), 'score': (np.float32, None)}
+                self.buckets[tier] = None
+            self.tiers[tier] = RingColumns(capacities[tier], columns)
+
+    def append(self, timestamp, values, score=None):
+        if self.last is not None and timestamp < self.last:
+            timestamp = self.last
+        self.last = timestamp
+        values = np.asarray(values, dtype=np.float64)
+        score = np.nan if score is None else score
+
+        raw = self.tiers['raw']
+        raw.append({'timestamp': timestamp, 'values': values, 'score': score})
+        if self.max_age is not None:
+            cutoff = timestamp - int(self.max_age * 1000)
+            raw.drop(int(np.searchsorted(raw.view('timestamp'), cutoff)))
+
+        for tier, bucket in self.buckets.items():
+            step = TIERS[tier] * 1000
+            start = timestamp - timestamp % step
+            if bucket is not None and bucket['timestamp'] != start:
+                self._close(tier, bucket)
+                bucket = None
+            if bucket is None:
+                self.buckets[tier] = {'timestamp': start, 'count': 1, 'sum': values.copy(),
+                                      'min': values.copy(), 'max': values.copy(), 'score': score}
+            else:
+                bucket['count'] += 1
+                bucket['sum'] += values
+                np.minimum(bucket['min'], values, out=bucket['min'])
+                np.maximum(bucket['max'], values, out=bucket['max'])
+                bucket['score'] = np.fmin(bucket['score'], score)
+
+    def _close(self, tier, bucket):
+        self.tiers[tier].append({'timestamp': bucket['timestamp'], 'count': bucket['count'],
+                                 'mean': bucket['sum'] / bucket['count'], 'min': bucket['min'],
+                                 'max': bucket['max'], 'score': bucket['score']})
+
+    def range(self, tier='raw', start=None, end=None, limit=None):
+        """Views of every column for timestamps in [start, end], keeping the last `limit` rows.
+
+        Bucketed tiers only hold closed buckets, so the current minute or hour
+        shows up once it has ended.
+        """
+        ring = self.tiers[tier]
+        timestamps = ring.view('timestamp')
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+        hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='right'))
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return {name: ring.view(name, lo, hi) for name in ring.arrays}
+
+
+class TimeSeriesStore:
+    """Thread-safe map of (topic, device) to Series, fed by the MQTT connections.
+
+    Queries copy the requested rows while holding the lock: the ring arrays
+    are overwritten in place by the network threads, so a view could change,
+    or its columns disagree, while it is being serialized. Device ids come
+    from the senders, so at most `max_series` series are kept: a new one
+    replaces the series that has gone longest without a sample.
+    """
+
+    def __init__(self, raw_capacity=100000, minute_capacity=7 * 24 * 60, hour_capacity=365 * 24, max_age=24 * 3600,
+                 max_series=1000):
+        self.capacities = {'raw': raw_capacity, '1min': minute_capacity, '1hour': hour_capacity}
+        self.max_age = max_age
+        self.max_series = max_series
+        self.series = OrderedDict()
+        self.lock = threading.Lock()
+
+    def append(self, topic, device, fields, timestamp, values, score=None):
+        key = (topic, device)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series(fields, self.capacities, self.max_age)
+                if self.max_series is not None and len(self.series) > self.max_series:
+                    (old_topic, old_device), _ = self.series.popitem(last=False)
+                    logging.info(f'Dropping idle series of {old_topic} (device {old_device}).')
+            else:
+                self.series.move_to_end(key)
+            if len(values) != len(series.fields):
+                logging.warning(f'Dropping sample with {len(values)} fields on {topic} '
+                                f'(device {device}), expected {len(series.fields)}.')
+                return False
+            series.append(timestamp, values, score)
+            return True
+
+    def topics(self):
+        with self.lock:
+            return {topic for topic, _ in self.series}
+
+    def devices(self, topic):
+        with self.lock:
+            return [device for t, device in self.series if t == topic]
+
+    def query(self, topic, device=None, tier='raw', start=None, end=None, limit=None):
+        if tier not in TIERS:
+            raise ValueError(f'Unknown tier {tier}; expected one of {list(TIERS)}')
+        with self.lock:
+            series = self.series.get((topic, device))
+            if series is None:
+                return None
+            columns = {name: view.copy() for name, view in series.range(tier, start, end, limit).items()}
+            columns['fields'] = list(series.fields)
+            return columns
+
+    def remove(self, topic):
+        with self.lock:
+            for key in [key for key in self.series if key[0] == topic]:
+                del self.series[key]
@@ -0,0 +1,31 @@
+import hashlib
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+# Every widget change reruns the page script. Parsed uploads and backend
+# results are cached across reruns and sessions, bounded by entry count and
+# age: st.cache_data has no byte limit, so the counts are the memory caps.
+UPLOAD_CACHE_ENTRIES = 4  # parsed CSV frames, the largest objects kept
+RESULT_CACHE_ENTRIES = 32  # detection and classification results
+CACHE_TTL = 3600  # seconds
+
+
+def upload_digest(uploaded_file):
+    """Content hash of an upload, computed once per uploaded file and session."""
+    key = (getattr(uploaded_file, 'file_id', uploaded_file.name), uploaded_file.size)
+    digests = st.session_state.setdefault('upload_digests', {})
+    if key not in digests:
+        digests.clear()
+        digests[key] = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    return digests[key]
+
+
+@st.cache_resource
+def backend_session():
+    """HTTP session shared by every Streamlit session, so backend calls reuse pooled connections."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount('http://', adapter)
+    return session
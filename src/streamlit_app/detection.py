@@ -7,32 +7,63 @@ import paho.mqtt.client as mqtt
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 import json
+import io
+import time
+import numpy as np
+from collections import deque
+from caching import CACHE_TTL, RESULT_CACHE_ENTRIES, UPLOAD_CACHE_ENTRIES, backend_session, upload_digest
 
 broker = ""
 port = ""
 topic = ""
  
+@st.cache_data(max_entries=UPLOAD_CACHE_ENTRIES, ttl=CACHE_TTL, show_spinner="Reading the dataset...")
+def read_dataset(digest, _uploaded_file):
+    # Keyed by the content digest only; the file object itself is not hashed.
+    _uploaded_file.seek(0)
+    df = pd.read_csv(_uploaded_file)
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'], errors='coerce')
+        df = df.set_index('date').resample('D').ffill().reset_index()
+    df = df.dropna()
+    return df
+
 def load_data(file_path):
     try:
-        df = pd.read_csv(file_path)
-        if 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
-            df = df.set_index('date').resample('D').ffill().reset_index()
-        df = df.dropna()
-        return df
+        return read_dataset(upload_digest(file_path), file_path)
     except FileNotFoundError:
         st.error("Please upload a valid CSV file.")
         return None
 
+def enable_stream_detection(broker, port, topic, algorithm):
+    try:
+        payload = {'broker': broker, 'port': port, 'topic': topic, 'algorithm': algorithm}
+        response = backend_session().post('http://127.0.0.1:5000/stream_detection', json=payload)
+        response.raise_for_status()
+        return True
+    except (requests.exceptions.RequestException, Exception) as e:
+        logging.error(f"An error occurred: {str(e)}")
+        return False
+
+def load_preview(uploaded_file, nrows=1000):
+    # Streaming mode only parses the head of the file up front; the rest is read chunk by chunk.
+    df = pd.read_csv(uploaded_file, nrows=nrows)
+    uploaded_file.seek(0)
+    return df
+
+def read_chunks(uploaded_file, columns, chunk_rows):
+    uploaded_file.seek(0)
+    for chunk in pd.read_csv(uploaded_file, usecols=columns, chunksize=chunk_rows):
+        yield chunk.dropna()
+
 def visualize(broker, port, topic):
     try:
         payload = {'broker': broker, 'port': port, 'topic': topic}
-        response = requests.post('http://127.0.0.1:5000/subscribe_mqtt_topic', json=payload)
+        response = backend_session().post('http://127.0.0.1:5000/subscribe_mqtt_topic', json=payload)
         
         if response.status_code == 200:
             response_data = response.json()
-            payload_data = response_data.get('payload')  # Retrieve the payload from the response
-            return payload_data  # Return the payload data
+            return response_data  # Payload plus any streaming anomaly scores
         else:
             logging.error(f"Failed to subscribe to MQTT topic. Status code: {response.status_code}")
             return None
@@ -40,18 +71,177 @@ def visualize(broker, port, topic):
         logging.error(f"An error occurred: {str(e)}")
         return None   
 
-def detect_anomalies(data, algorithm, **parameters):
+def fetch_timeseries(broker, port, topic, device=None, tier="raw", limit=None):
+    """Stored samples of a topic from the backend's time-series store (raw, 1min or 1hour buckets)."""
+    try:
+        payload = {'broker': broker, 'port': port, 'topic': topic, 'device': device or None, 'tier': tier, 'limit': limit}
+        response = backend_session().post('http://127.0.0.1:5000/timeseries', json=payload)
+        if response.status_code == 200:
+            return response.json()
+        logging.error(f"Failed to fetch stored samples. Status code: {response.status_code}")
+        return None
+    except (requests.exceptions.RequestException, Exception) as e:
+        logging.error(f"An error occurred: {str(e)}")
+        return None
 
-    # Ensure data is converted to a dictionary suitable for JSON
-    data_dict = data.to_dict(orient='list')
+def show_history(history):
+    timestamps = pd.to_datetime(history['timestamp'], unit='ms')
+    fig = go.Figure()
+    for i, field in enumerate(history['fields']):
+        if history['tier'] == 'raw':
+            fig.add_trace(go.Scatter(x=timestamps, y=[row[i] for row in history['values']], name=field))
+        else:
+            fig.add_trace(go.Scatter(x=timestamps, y=[row[i] for row in history['mean']], name=f"{field} (mean)"))
+            fig.add_trace(go.Scatter(x=timestamps, y=[row[i] for row in history['max']], name=f"{field} (max)", line=dict(dash='dot')))
+            fig.add_trace(go.Scatter(x=timestamps, y=[row[i] for row in history['min']], name=f"{field} (min)", line=dict(dash='dot')))
+    # Buckets keep their lowest score, so an anomaly inside a minute or hour still marks it.
+    column = history['values'] if history['tier'] == 'raw' else history['max']
+    flagged = [i for i, score in enumerate(history['score']) if score is not None and score < 0]
+    if flagged:
+        fig.add_trace(go.Scatter(x=timestamps[flagged], y=[column[i][0] for i in flagged],
+                                 mode='markers', marker=dict(color='red', size=10), name='Anomaly'))
+    fig.update_layout(title=f"Stored history ({history['tier']})", xaxis_title="Received at")
+    st.plotly_chart(fig)
+    if len(history['devices']) > 1:
+        st.caption(f"Devices on this topic: {', '.join(str(d) for d in history['devices'])}")
+
+LIVE_WINDOW_POINTS = 1000  # newest records kept in the live chart
+LIVE_REFRESH_SECONDS = 0.5  # records are pushed, and the live chart redrawn, at most this often
+LIVE_TABLE_ROWS = 20
+
+def read_events(response):
+    """Yield (event, data) from a Server-Sent Events response; comments yield ("keepalive", None)."""
+    event, data = "message", []
+    # chunk_size=None hands over lines as soon as they arrive instead of filling a read buffer first.
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith(":"):
+            yield "keepalive", None
+        else:
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+
+def draw_live(placeholder, window):
+    times = pd.to_datetime([point[0] for point in window], unit='s')
+    fig = go.Figure()
+    for i, field in enumerate(window[-1][1]):
+        fig.add_trace(go.Scatter(x=times, y=[point[2][i] if i < len(point[2]) else None for point in window], name=field))
+    flagged = [k for k, point in enumerate(window) if point[3]]
+    if flagged:
+        fig.add_trace(go.Scatter(x=times[flagged], y=[window[k][2][0] for k in flagged],
+                                 mode='markers', marker=dict(color='red', size=10), name='Anomaly'))
+    fig.update_layout(title="Live stream", xaxis_title="Received at", uirevision="live")
+    placeholder.plotly_chart(fig)
+
+def live_stream(broker, port, topic, device=None):
+    """Append records pushed by the backend (/stream_mqtt) to a bounded chart window.
+
+    The window is seeded once from the stored history; after that only new
+    records cross the wire, over one long-lived connection.
+    """
+    window = deque(maxlen=LIVE_WINDOW_POINTS)  # (received_at, fields, values, anomaly)
+    history = fetch_timeseries(broker, port, topic, device, "raw", limit=LIVE_WINDOW_POINTS)
+    if history is not None:
+        for t, values, score in zip(history['timestamp'], history['values'], history['score']):
+            window.append((t / 1000, history['fields'], values, score is not None and score < 0))
+    st.subheader("Live stream")
+    status = st.empty()
+    placeholder = st.empty()
+    if window:
+        draw_live(placeholder, list(window))
+    received = anomalies = 0
+    alert_source = f"mqtt/{topic}" if device is None else f"mqtt/{topic}/{device}"
+    last_alert_poll = time.monotonic()
+    try:
+        # The backend batches records into one event per interval, so every event is one redraw.
+        params = {'broker': broker, 'port': port, 'topic': topic, 'device': device, 'interval': LIVE_REFRESH_SECONDS}
+        with backend_session().get('http://127.0.0.1:5000/stream_mqtt', params=params, stream=True, timeout=(5, None)) as response:
+            if response.status_code == 503:
+                status.warning("The backend is serving as many live streams as it can, try again later.")
+                return
+            response.raise_for_status()
+            for event, data in read_events(response):
+                if event == "end":
+                    status.info("The topic was unsubscribed.")
+                    break
+                if event == "records":
+                    for record in data:
+                        window.append((record['received_at'], record['fields'], record['values'], record['anomaly']))
+                        anomalies += record['anomaly']
+                    received += len(data)
+                    draw_live(placeholder, list(window))
+                if time.monotonic() - last_alert_poll >= ALERT_POLL_SECONDS:
+                    notify_alerts(fetch_alerts(source=alert_source, status="open"))
+                    last_alert_poll = time.monotonic()
+                status.caption(f"{received} new records, {anomalies} anomalies since connecting")
+    except (requests.exceptions.RequestException, Exception) as e:
+        logging.error(f"An error occurred: {str(e)}")
+        status.error("The live stream was interrupted.")
 
+ALERT_POLL_SECONDS = 5  # how often the live stream checks for new alerts
+
+def current_user():
+    # Alerts are rate-limited and listed per user.
+    return st.session_state.get("username") or None
+
+def fetch_alerts(user=None, source=None, status=None, limit=20):
     try:
-        # Remove unnecessary "thresholds" key from the payload since thresholds are no longer used
-        payload = {'data': data_dict, 'algorithm': algorithm}
-        payload.update(parameters)  # Add algorithm-specific parameters
+        params = {'user': user, 'source': source, 'status': status, 'limit': limit}
+        response = backend_session().get('http://127.0.0.1:5000/alerts', params=params)
+        response.raise_for_status()
+        return response.json()['alerts']
+    except (requests.exceptions.RequestException, Exception) as e:
+        logging.error(f"An error occurred: {str(e)}")
+        return []
+
+def notify_alerts(alerts):
+    """Pop up a toast for every alert this session has not shown yet."""
+    seen = st.session_state.setdefault("seen_alerts", set())
+    for alert in reversed(alerts):
+        if alert['id'] not in seen and not alert['suppressed']:
+            seen.add(alert['id'])
+            st.toast(f"🚨 {alert['rule']} alert on {alert['source']}: {alert['count']} anomalies (score {alert['score']:.3f})")
+
+def show_alerts(user=None, source=None):
+    alerts = fetch_alerts(user, source)
+    notify_alerts(alerts)
+    if alerts:
+        with st.expander(f"Recent alerts ({len(alerts)})"):
+            st.table(pd.DataFrame(alerts)[['rule', 'source', 'status', 'count', 'score', 'suppressed']])
+
+BINARY_MIN_ROWS = 10000  # frames at least this long are sent as a binary .npy body instead of JSON lists
+
+def encode_npy(data):
+    # Column-major float64 so the backend can wrap each column without copying.
+    buffer = io.BytesIO()
+    np.save(buffer, np.asfortranarray(data.to_numpy(dtype='<f8')), allow_pickle=False)
+    return buffer.getvalue()
 
+def post_frame(url, data, binary=None, **fields):
+    """POST a frame as JSON column lists, or as a binary .npy body with the other fields as query arguments."""
+    if binary is None:
+        binary = len(data) >= BINARY_MIN_ROWS and all(pd.api.types.is_numeric_dtype(t) for t in data.dtypes)
+    if binary:
+        params = {k: v if isinstance(v, str) else json.dumps(v) for k, v in fields.items() if v is not None}
+        params['columns'] = json.dumps([str(c) for c in data.columns])
+        return backend_session().post(url, data=encode_npy(data), params=params, headers={'Content-Type': 'application/x-npy'})
+    # Ensure data is converted to a dictionary suitable for JSON
+    payload = dict(fields, data=data.to_dict(orient='list'))
+    return backend_session().post(url, json=payload)
+
+def detect_anomalies(data, algorithm, **parameters):
+
+    try:
         # Send the request to the backend server
-        response = requests.post('http://127.0.0.1:5000/detect_anomalies', json=payload)
+        response = post_frame('http://127.0.0.1:5000/detect_anomalies', data, algorithm=algorithm, parameters=parameters,
+                              user=current_user())
 
         # Return the response if successful
         response.raise_for_status()  # Raise an error for non-2xx status codes
@@ -62,18 +252,222 @@ def detect_anomalies(data, algorithm, **parameters):
         logging.error(f"An error occurred: {str(e)}")
         return None
 
+def detect_anomalies_ensemble(data, parameters):
+    """Run every detector in one request; returns per-algorithm scores and the combined rank score."""
+    try:
+        response = post_frame('http://127.0.0.1:5000/detect_anomalies_ensemble', data, parameters=parameters)
+        response.raise_for_status()
+        return response.json()
+    except (requests.exceptions.RequestException, Exception) as e:
+        logging.error(f"An error occurred: {str(e)}")
+        return None
+
+ENSEMBLE_TOP_ROWS = 20  # most anomalous rows listed for an ensemble run
+
+def show_ensemble(result):
+    scores = pd.DataFrame(result['scores'])
+    scores['combined'] = result['combined']
+    st.subheader("Ensemble scores")
+    st.write("`combined` is the mean rank of each detector's score, from 0 (most normal) to 1 (most anomalous).")
+    st.plotly_chart(px.line(scores, y='combined', title="Combined anomaly score"))
+    st.subheader(f"Top {ENSEMBLE_TOP_ROWS} anomalies")
+    st.table(scores.sort_values('combined', ascending=False).head(ENSEMBLE_TOP_ROWS))
+
+STATISTICAL_ALGORITHMS = ["rolling_zscore", "ewma", "rolling_mad", "seasonal"]  # time-series detectors scored in order
+
+HISTORY_MAX_POINTS = 5000  # newest stored samples or buckets charted under the live stream
+
+JOB_MIN_ROWS = 50000  # frames at least this long run as a backend job instead of a blocking request
+JOB_POLL_SECONDS = 1.0
+
+def run_detection_job(data, algorithm, **parameters):
+    """Submit a detection job and poll it, showing its progress, until it ends."""
+    try:
+        response = post_frame('http://127.0.0.1:5000/jobs', data, algorithm=algorithm, parameters=parameters, user=current_user())
+        response.raise_for_status()
+        job = response.json()
+        progress = st.progress(0.0, text="Detection job queued...")
+        while job['status'] in ('pending', 'running'):
+            time.sleep(JOB_POLL_SECONDS)
+            job = backend_session().get(f"http://127.0.0.1:5000/jobs/{job['job_id']}").json()
+            progress.progress(job['progress'], text=f"Detection job {job['status']}...")
+        if job['status'] != 'finished':
+            logging.error(f"Detection job {job['job_id']} ended as {job['status']}: {job.get('error')}")
+            return None
+        progress.progress(1.0, text="Detection job finished")
+        response = backend_session().get(f"http://127.0.0.1:5000/jobs/{job['job_id']}/result")
+        response.raise_for_status()
+        return response.json()
+    except (requests.exceptions.RequestException, Exception) as e:
+        logging.error(f"An error occurred: {str(e)}")
+        return None
+
+
+class DetectionFailed(Exception):
+    pass
+
+@st.cache_data(max_entries=RESULT_CACHE_ENTRIES, ttl=CACHE_TTL, show_spinner=False)
+def _cached_detection(data_key, algorithm, parameters, _data):
+    # Failures raise instead of returning None so that they are not cached.
+    if algorithm == "ensemble":
+        result = detect_anomalies_ensemble(_data, parameters)
+    elif len(_data) >= JOB_MIN_ROWS and algorithm not in STATISTICAL_ALGORITHMS:
+        result = run_detection_job(_data, algorithm, **parameters)
+    else:
+        response = detect_anomalies(_data, algorithm, **parameters)
+        result = response.json() if response is not None and response.status_code == 200 else None
+    if result is None:
+        raise DetectionFailed(algorithm)
+    return result
+
+def cached_detection(data_key, algorithm, parameters, data):
+    """Detection result for `data`, cached by (upload digest, features), algorithm and parameters; None on failure."""
+    try:
+        return _cached_detection(data_key, algorithm, parameters, data)
+    except DetectionFailed:
+        return None
+
+STREAMING_MIN_BYTES = 20 * 1024 * 1024  # uploads larger than this default to streaming mode
+STREAM_CHUNK_ROWS = 50000
+MAX_ANOMALY_ROWS = 1000  # anomalies kept for display in streaming mode
+
+def detect_anomalies_chunk(data, algorithm, model_id=None, **parameters):
+    try:
+        response = post_frame('http://127.0.0.1:5000/detect_anomalies_chunk', data, binary=True,
+                              algorithm=algorithm, parameters=parameters, model_id=model_id, user=current_user())
+        response.raise_for_status()
+        return response.json()
+    except (requests.exceptions.RequestException, Exception) as e:
+        logging.error(f"An error occurred: {str(e)}")
+        return None
+
+CHART_MAX_POINTS = 5000  # frames longer than this are charted from downsampled ranges served by the backend
+CHART_POINTS = 2000  # points per column requested for one chart range
+SCORE_COLUMN = "__anomaly_score__"
+
+def upload_series(frame):
+    """Keep a chart frame on the backend once per content; returns its series id."""
+    key = int(pd.util.hash_pandas_object(frame, index=False).sum())
+    series = st.session_state.setdefault("chart_series", {})
+    if key not in series:
+        score_column = SCORE_COLUMN if SCORE_COLUMN in frame.columns else None
+        response = post_frame('http://127.0.0.1:5000/series', frame, score_column=score_column)
+        response.raise_for_status()
+        series[key] = response.json()['series_id']
+    return key, series[key]
+
+def fetch_chart_range(frame, start, end, method="lttb"):
+    """Downsampled rows [start, end) of every column; anomalies in the score column are always included."""
+    try:
+        for _ in range(2):
+            key, series_id = upload_series(frame)
+            response = backend_session().get(f'http://127.0.0.1:5000/series/{series_id}',
+                                    params={'start': start, 'end': end, 'points': CHART_POINTS, 'method': method})
+            if response.status_code != 404:
+                response.raise_for_status()
+                return response.json()
+            # Evicted from the backend's series cache: upload again.
+            del st.session_state.chart_series[key]
+        return None
+    except (requests.exceptions.RequestException, Exception) as e:
+        logging.error(f"An error occurred: {str(e)}")
+        return None
+
+def show_charts(df, selected_features, graph_type, scores=None):
+    """Chart every selected feature, with red markers on anomalies (negative scores).
+
+    Long frames are not sent to the browser whole: the backend returns a few
+    thousand LTTB-selected points for the chosen row range, so narrowing the
+    range shows it at higher resolution.
+    """
+    if not graph_type or not selected_features:
+        return
+    if len(df) > CHART_MAX_POINTS:
+        start, end = st.slider("Chart range (rows)", min_value=0, max_value=len(df), value=(0, len(df)),
+                               help="Narrow the range to load it at a higher resolution.")
+        frame = df[selected_features].reset_index(drop=True)
+        if scores is not None:
+            frame[SCORE_COLUMN] = pd.to_numeric(pd.Series(scores, dtype=object), errors='coerce').to_numpy()
+        ranged = fetch_chart_range(frame, start, end)
+        if ranged is None:
+            st.warning("Could not load the chart data from the backend.")
+            return
+        series = {column: (ranged['columns'][column]['index'], ranged['columns'][column]['value']) for column in selected_features}
+        anomalies = set(ranged.get('anomalies', {}).get('index', []))
+    else:
+        series = {column: (list(range(len(df))), df[column].tolist()) for column in selected_features}
+        anomalies = {i for i, score in enumerate(scores) if score is not None and score < 0} if scores else set()
+    dates = df['date'].to_numpy() if 'date' in df.columns else None
+    for chart_type in graph_type:
+        for column in selected_features:
+            index, values = series[column]
+            x = dates[index] if dates is not None else index
+            fig = go.Figure(go.Scatter(x=x, y=values, mode='lines' if chart_type == "Line Chart" else 'markers', name=column))
+            flagged = [i for i, row in enumerate(index) if row in anomalies]
+            if flagged:
+                fig.add_trace(go.Scatter(x=[x[i] for i in flagged], y=[values[i] for i in flagged],
+                                         mode='markers', marker=dict(color='red', size=8), name='Anomaly'))
+            fig.update_layout(title=f"{chart_type}: {column}", xaxis_title='date' if dates is not None else 'Index', yaxis_title=column)
+            st.plotly_chart(fig)
+
+def run_streaming_detection(uploaded_file, selected_features, algorithm, parameters):
+    """Score the upload chunk by chunk, keeping only counters and the most recent anomalies in memory."""
+    if not selected_features:
+        st.warning("Select at least one feature for anomaly detection.")
+        return
+    progress = st.progress(0.0, text="Scoring chunks...")
+    summary = st.empty()
+    chart = st.empty()
+    table = st.empty()
+
+    model_id = None
+    rows = 0
+    n_anomalies = 0
+    anomalies = deque(maxlen=MAX_ANOMALY_ROWS)
+    for chunk in read_chunks(uploaded_file, selected_features, STREAM_CHUNK_ROWS):
+        if chunk.empty:
+            continue
+        # The first chunk fits the model on the backend, later chunks are only scored against it.
+        result = detect_anomalies_chunk(chunk[selected_features], algorithm, model_id, **parameters)
+        if result is None:
+            st.error("An error occurred during anomaly detection.")
+            st.toast("Please check the backend server and try again.")
+            return
+        model_id = result['model_id']
+        scores = np.asarray(result['scores'])
+        mask = scores < 0
+        anomalies.extend(zip(chunk.index[mask], scores[mask]))
+        rows += len(chunk)
+        n_anomalies += int(mask.sum())
+
+        progress.progress(min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0), text=f"Scored {rows} rows")
+        summary.write(f"Rows scored: {rows} — anomalies found: {n_anomalies}")
+        if anomalies:
+            anomaly_df = pd.DataFrame(list(anomalies), columns=['Index', 'Anomaly'])
+            chart.plotly_chart(px.scatter(anomaly_df, x='Index', y='Anomaly', title="Anomalies found so far"))
+            table.dataframe(anomaly_df)
+
+    progress.progress(1.0, text=f"Scored {rows} rows")
+    if n_anomalies:
+        st.info(f"{n_anomalies} anomalies detected. The last {len(anomalies)} are shown above.")
+    else:
+        st.success("No anomalies detected.")
 
 def detection_page():
     st.title("Anomaly Detection")
     st.write("Upload a CSV dataset and choose the features to run anomaly detection on.")
     uploaded_file = st.file_uploader("Choose a CSV file", type=["csv"])
     if uploaded_file is not None:
-        df = load_data(uploaded_file)
+        streaming = st.sidebar.checkbox("Streaming mode (large files)", value=uploaded_file.size >= STREAMING_MIN_BYTES)
+        if streaming:
+            df = load_preview(uploaded_file)
+        else:
+            df = load_data(uploaded_file)
         st.subheader("Dataset")
         st.write(df)
         st.sidebar.title("Parameters")
         graph_type = st.sidebar.multiselect("Select Graph Type", ["Line Chart", "Scatter Plot"])
-        algorithm = st.sidebar.selectbox("Select Anomaly Detection Algorithm", ["isolation_forest", "SVM", "DBSCAN"])
+        algorithm = st.sidebar.selectbox("Select Anomaly Detection Algorithm", ["isolation_forest", "SVM", "DBSCAN", "ensemble"] + STATISTICAL_ALGORITHMS)
         selected_features = st.sidebar.multiselect("Select Features for Anomaly Detection", [col for col in df.columns.tolist() if col != "date"], default=None)
         parameters = {}
         if algorithm == "isolation_forest":
@@ -81,44 +475,70 @@ def detection_page():
             parameters["n_estimators"] = st.sidebar.slider("Number of Trees", min_value=10, max_value=1000, value=100)
         elif algorithm == "SVM":
             parameters["kernel"] = st.sidebar.selectbox("Kernel", ["linear", "rbf"])
-            parameters["C"] = st.sidebar.slider("Regularization Parameter", min_value=0.1, max_value=100.0, value=1.0)
+            parameters["nu"] = st.sidebar.slider("Nu (outlier fraction bound)", min_value=0.01, max_value=0.5, value=0.1)
         elif algorithm == "DBSCAN":
             parameters["eps"] = st.sidebar.slider("Epsilon (minimum distance)", min_value=0.0, max_value=1.0, value=0.5)
             parameters["min_samples"] = st.sidebar.slider("Minimum Samples", min_value=1, max_value=len(df), value=5)
+        elif algorithm == "ensemble":
+            # One upload and one preprocessing pass for all three detectors.
+            parameters["isolation_forest"] = {"contamination": st.sidebar.slider("Contamination (outlier %)", min_value=0.0, max_value=0.5, value=0.1)}
+            parameters["SVM"] = {"nu": st.sidebar.slider("Nu (outlier fraction bound)", min_value=0.01, max_value=0.5, value=0.1)}
+            parameters["DBSCAN"] = {"eps": st.sidebar.slider("Epsilon (minimum distance)", min_value=0.0, max_value=1.0, value=0.5),
+                                    "min_samples": st.sidebar.slider("Minimum Samples", min_value=1, max_value=len(df), value=5)}
+        elif algorithm in ("rolling_zscore", "rolling_mad"):
+            parameters["window"] = st.sidebar.slider("Window (samples)", min_value=5, max_value=1000, value=60)
+            parameters["threshold"] = st.sidebar.slider("Threshold (standard deviations)", min_value=1.0, max_value=10.0, value=3.5 if algorithm == "rolling_mad" else 3.0)
+        elif algorithm == "ewma":
+            parameters["alpha"] = st.sidebar.slider("Alpha (weight of the newest sample)", min_value=0.01, max_value=1.0, value=0.1)
+            parameters["threshold"] = st.sidebar.slider("Threshold (standard deviations)", min_value=1.0, max_value=10.0, value=3.0)
+        elif algorithm == "seasonal":
+            parameters["period"] = st.sidebar.slider("Season length (samples)", min_value=2, max_value=1440, value=24)
+            parameters["alpha"] = st.sidebar.slider("Alpha (weight of the newest season)", min_value=0.01, max_value=1.0, value=0.1)
+            parameters["threshold"] = st.sidebar.slider("Threshold (standard deviations)", min_value=1.0, max_value=10.0, value=3.0)
         if st.sidebar.button("Run Anomaly Detection"):
+            if streaming and algorithm == "ensemble":
+                st.warning("The ensemble needs the whole dataset; turn off streaming mode to run it.")
+                return
+            if streaming and algorithm in STATISTICAL_ALGORITHMS:
+                st.warning("Time-series detectors score the rows in order; turn off streaming mode to run them.")
+                return
+            if streaming:
+                run_streaming_detection(uploaded_file, selected_features, algorithm, parameters)
+                return
+            if algorithm == "ensemble" and len(df) > JOB_MIN_ROWS:
+                # The ensemble fits its models within one request, which the backend caps in length.
+                st.warning(f"The ensemble runs on at most {JOB_MIN_ROWS} rows; pick a single algorithm for larger uploads.")
+                return
             with st.spinner("Detecting anomalies..."):
                 data = df[selected_features]
-                response = detect_anomalies(data, algorithm, **parameters)
-                if response is not None and response.status_code == 200:
-                    anomaly_indices = response.json()
-                    if anomaly_indices:
-                        st.info("Anomalies detected! See details below.")
-                        anomaly_df = pd.DataFrame({'Index': range(len(df)), 'Anomaly': anomaly_indices})
-                        st.subheader("Anomaly Data Points")
-                        st.table(anomaly_df[anomaly_df['Anomaly'] < 0])
+                anomaly_indices = None
+                result = cached_detection((upload_digest(uploaded_file), tuple(selected_features)), algorithm, parameters, data)
+                if algorithm == "ensemble":
+                    if result is not None:
+                        show_ensemble(result)
                     else:
-                        st.success("No anomalies detected.")
+                        st.error("An error occurred during anomaly detection.")
+                        st.toast("Please check the backend server and try again.")
                 else:
-                    st.error("An error occurred during anomaly detection.")
-                    st.toast("Please check the backend server and try again.")
-                num_charts = len(graph_type)
-                chart_rows = st.columns(num_charts)
-                for chart_type, chart_col in zip(graph_type, chart_rows):
-                    for column in selected_features:
-                        x = 'date' if 'date' in df.columns else None
-                        if chart_type == "Line Chart":
-                            if x:
-                                fig = px.line(df, x=x, y=column, title="Line Chart")
-                            else:
-                                fig = px.line(df, y=column, title="Line Chart")
-                        elif chart_type == "Scatter Plot":
-                            if x:
-                                fig = px.scatter(df, x=x, y=column, title="Scatter Plot")
-                            else:
-                                fig = px.scatter(df, y=column, title="Scatter Plot")
-                        st.plotly_chart(fig)
-                        if chart_col.index == 0:
-                            chart_col.write("")
+                    anomaly_indices = result
+                    if anomaly_indices is not None:
+                        if anomaly_indices:
+                            st.info("Anomalies detected! See details below.")
+                            anomaly_df = pd.DataFrame({'Index': range(len(df)), 'Anomaly': anomaly_indices})
+                            st.subheader("Anomaly Data Points")
+                            st.table(anomaly_df[anomaly_df['Anomaly'] < 0])
+                        else:
+                            st.success("No anomalies detected.")
+                    else:
+                        st.error("An error occurred during anomaly detection.")
+                        st.toast("Please check the backend server and try again.")
+            st.session_state.charted = {'file': upload_digest(uploaded_file), 'features': list(selected_features),
+                                        'scores': anomaly_indices if algorithm != "ensemble" else None}
+        charted = st.session_state.get("charted")
+        if charted is not None and charted['file'] == upload_digest(uploaded_file) and charted['features'] == list(selected_features):
+            show_charts(df, selected_features, graph_type, charted['scores'])
+        # Alerts are raised asynchronously, so ones from this run may only show on the next rerun.
+        show_alerts(user=current_user())
     else:
         st.error("select a file")
 
@@ -139,11 +559,23 @@ def detect():
             broker = st.text_input("Broker", "localhost")
             port = st.text_input("Port", "1883")
             topic = st.text_input("Topic", "topic_name")
+            stream_algorithm = st.selectbox("Streaming Anomaly Detection", ["None", "zscore", "isolation_forest", "SVM"] + STATISTICAL_ALGORITHMS)
+            device = st.text_input("Device (optional)", "")
+            history_tier = st.selectbox("History", ["raw", "1min", "1hour"])
+            live = st.checkbox("Live updates", value=True)
             submit_button = st.form_submit_button("Submit")
         
             if submit_button:
+                st.session_state.mqtt_live = (broker, int(port), topic, device or None) if live else None
                 try:
-                    response = visualize(broker, int(port), topic)
+                    if stream_algorithm != "None" and st.session_state.get("stream_detection") != (broker, port, topic, stream_algorithm):
+                        if enable_stream_detection(broker, int(port), topic, stream_algorithm):
+                            st.session_state.stream_detection = (broker, port, topic, stream_algorithm)
+                        else:
+                            st.warning("Could not enable streaming anomaly detection.")
+                    response_data = visualize(broker, int(port), topic)
+                    response = response_data.get('payload') if response_data is not None else None
+                    scores = response_data.get('scores', []) if response_data is not None else []
                     if response is not None:
                         st.subheader("Data stream")
 
@@ -163,12 +595,23 @@ def detect():
                                 xaxis_title="Timestamp",
                                 yaxis_title="Payload"
                             )
+                            anomalies = [entry for entry in scores if entry['anomaly']]
+                            if anomalies:
+                                fig.add_trace(go.Scatter(x=[entry['timestamp'] for entry in anomalies],
+                                                         y=[entry['values'][0] for entry in anomalies],
+                                                         mode='markers', marker=dict(color='red', size=10),
+                                                         name='Anomaly'))
+                                st.info(f"{len(anomalies)} anomalies detected in the recent stream.")
                             st.plotly_chart(fig)
 
                             logger.info("Displaying response in a table...")
                             # Display response in a table
-                            st.write("Response:")
-                            st.table(response)
+                            st.write("Latest messages:")
+                            st.table(response[-LIVE_TABLE_ROWS:])
+
+                            history = fetch_timeseries(broker, int(port), topic, device, history_tier, limit=HISTORY_MAX_POINTS)
+                            if history is not None:
+                                show_history(history)
                         else:
                             logger.warning("Unexpected response format. Unable to visualize data.")
                             st.warning("Unexpected response format. Unable to visualize data.")
@@ -177,4 +620,11 @@ def detect():
                         st.error("An error occurred during connecting.")
                 except Exception as e:
                     logger.error(f"An error occurred during connecting: {str(e)}")
-                    st.error("An error occurred during connecting.")
\ No newline at end of file
+                    st.error("An error occurred during connecting.")
+
+        if st.session_state.get("mqtt_live") is not None:
+            # Any widget interaction, including this button, reruns the script and ends the stream loop.
+            if st.button("Stop live updates"):
+                st.session_state.mqtt_live = None
+            else:
+                live_stream(*st.session_state.mqtt_live)
\ No newline at end of file
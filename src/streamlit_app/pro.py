@@ -1,24 +1,40 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from sklearn.preprocessing import StandardScaler
-from joblib import load
+import requests
+import logging
+from caching import CACHE_TTL, RESULT_CACHE_ENTRIES, UPLOAD_CACHE_ENTRIES, upload_digest
+from detection import post_frame
+
+@st.cache_data(max_entries=UPLOAD_CACHE_ENTRIES, ttl=CACHE_TTL, show_spinner="Reading the dataset...")
+def read_upload(digest, _uploaded_file):
+    _uploaded_file.seek(0)
+    return pd.read_csv(_uploaded_file)
 
 def load_data(uploaded_file):
-    new_test_data = pd.read_csv(uploaded_file)
+    # A copy of the cached frame, so adding the prediction columns does not touch the cache.
+    new_test_data = read_upload(upload_digest(uploaded_file), uploaded_file)
     X_columns = ['IAT', 'rst_count', 'urg_count', 'flow_duration', 'Variance', 'Duration', 'Header_Length', 'Number', 'Weight', 'Rate']
     return new_test_data, X_columns
 
-def make_predictions(new_test_data, X_columns):
-    model_8_classes = load("models/newRandomForest_model_8_classes.joblib")
-    model_2_classes = load("models/newRandomForest_model_2_classes.joblib")
-    scaler = StandardScaler()
-    scaler.fit(new_test_data[X_columns])
-    new_test_data[X_columns] = scaler.transform(new_test_data[X_columns])
-    predictions_8_classes = model_8_classes.predict(new_test_data[X_columns])
-    predictions_2_classes = model_2_classes.predict(new_test_data[X_columns])
-    new_test_data['predictions_2'] = predictions_2_classes
-    new_test_data['predictions_8'] = predictions_8_classes
+@st.cache_data(max_entries=RESULT_CACHE_ENTRIES, ttl=CACHE_TTL, show_spinner="Classifying...")
+def classify(digest, _features):
+    # Errors propagate, so only successful predictions are cached.
+    response = post_frame('http://127.0.0.1:5000/classify_traffic', _features)
+    response.raise_for_status()
+    return response.json()
+
+def make_predictions(new_test_data, digest):
+    # The classifiers are loaded once by the backend and shared across requests. Each model
+    # picks the feature columns it was trained on, so every numeric column is sent.
+    features = new_test_data.select_dtypes('number')
+    try:
+        predictions = classify(digest, features)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"An error occurred: {str(e)}")
+        return None
+    new_test_data['predictions_2'] = predictions['predictions_2']
+    new_test_data['predictions_8'] = predictions['predictions_8']
     return new_test_data
 
 def visualize_data(new_test_data):
@@ -50,6 +66,10 @@ def pro_page():
                 scatter_fig = px.scatter(scatter_data, title=f"Scatter Plot of Selected Features: {', '.join(selected_features)}")
                 st.plotly_chart(scatter_fig)
             if st.button("Launch"):
-                new_test_data = make_predictions(new_test_data, X_columns)
-                st.write(new_test_data)
-                visualize_data(new_test_data)
+                new_test_data = make_predictions(new_test_data, upload_digest(uploaded_file))
+                if new_test_data is not None:
+                    st.write(new_test_data)
+                    visualize_data(new_test_data)
+                else:
+                    st.error("An error occurred during classification.")
+                    st.toast("Please check the backend server and try again.")
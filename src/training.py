@@ -0,0 +1,423 @@
+import json
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from joblib import dump, effective_n_jobs
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, recall_score, precision_score, f1_score
+from sklearn.preprocessing import StandardScaler
+from tqdm import tqdm
+
+from flask_app.forest_engine import ForestEngine, compact_forest, compile_forest, save_forest
+
+X_COLUMNS = ['flow_duration', 'Header_Length', 'Protocol Type', 'Duration', 'Rate', 'Srate', 'Drate', 'fin_flag_number',
+             'syn_flag_number', 'rst_flag_number', 'psh_flag_number', 'ack_flag_number', 'ece_flag_number',
+             'cwr_flag_number', 'ack_count', 'syn_count', 'fin_count', 'urg_count', 'rst_count', 'HTTP', 'HTTPS',
+             'DNS', 'Telnet', 'SMTP', 'SSH', 'IRC', 'TCP', 'UDP', 'DHCP', 'ARP', 'ICMP', 'IPv', 'LLC', 'Tot sum',
+             'Min', 'Max', 'AVG', 'Std', 'Tot size', 'IAT', 'Number', 'Magnitue', 'Radius', 'Covariance', 'Variance',
+             'Weight']
+Y_COLUMN = 'label'
+
+# Every CICIoT2023 label, in the order used for the integer label codes of cached shards.
+LABELS = ['Backdoor_Malware', 'BenignTraffic', 'BrowserHijacking', 'CommandInjection', 'DDoS-ACK_Fragmentation',
+          'DDoS-HTTP_Flood', 'DDoS-ICMP_Flood', 'DDoS-ICMP_Fragmentation', 'DDoS-PSHACK_Flood', 'DDoS-RSTFINFlood',
+          'DDoS-SYN_Flood', 'DDoS-SlowLoris', 'DDoS-SynonymousIP_Flood', 'DDoS-TCP_Flood', 'DDoS-UDP_Flood',
+          'DDoS-UDP_Fragmentation', 'DNS_Spoofing', 'DictionaryBruteForce', 'DoS-HTTP_Flood', 'DoS-SYN_Flood',
+          'DoS-TCP_Flood', 'DoS-UDP_Flood', 'MITM-ArpSpoofing', 'Mirai-greeth_flood', 'Mirai-greip_flood',
+          'Mirai-udpplain', 'Recon-HostDiscovery', 'Recon-OSScan', 'Recon-PingSweep', 'Recon-PortScan',
+          'SqlInjection', 'Uploading_Attack', 'VulnerabilityScan', 'XSS']
+
+# Label groupings for the 8 (7+1) and 2 (1+1) class problems.
+LABELS_8_CLASSES = {
+    'DDoS-RSTFINFlood': 'DDoS',
+    'DDoS-PSHACK_Flood': 'DDoS',
+    'DDoS-SYN_Flood': 'DDoS',
+    'DDoS-UDP_Flood': 'DDoS',
+    'DDoS-TCP_Flood': 'DDoS',
+    'DDoS-ICMP_Flood': 'DDoS',
+    'DDoS-SynonymousIP_Flood': 'DDoS',
+    'DDoS-ACK_Fragmentation': 'DDoS',
+    'DDoS-UDP_Fragmentation': 'DDoS',
+    'DDoS-ICMP_Fragmentation': 'DDoS',
+    'DDoS-SlowLoris': 'DDoS',
+    'DDoS-HTTP_Flood': 'DDoS',
+
+    'DoS-UDP_Flood': 'DoS',
+    'DoS-SYN_Flood': 'DoS',
+    'DoS-TCP_Flood': 'DoS',
+    'DoS-HTTP_Flood': 'DoS',
+
+    'Mirai-greeth_flood': 'Mirai',
+    'Mirai-greip_flood': 'Mirai',
+    'Mirai-udpplain': 'Mirai',
+
+    'Recon-PingSweep': 'Recon',
+    'Recon-OSScan': 'Recon',
+    'Recon-PortScan': 'Recon',
+    'VulnerabilityScan': 'Recon',
+    'Recon-HostDiscovery': 'Recon',
+
+    'DNS_Spoofing': 'Spoofing',
+    'MITM-ArpSpoofing': 'Spoofing',
+
+    'BenignTraffic': 'Benign',
+
+    'BrowserHijacking': 'Web',
+    'Backdoor_Malware': 'Web',
+    'XSS': 'Web',
+    'Uploading_Attack': 'Web',
+    'SqlInjection': 'Web',
+    'CommandInjection': 'Web',
+
+    'DictionaryBruteForce': 'BruteForce',
+}
+
+LABELS_2_CLASSES = {
+    'DDoS-RSTFINFlood': 'Attack',
+    'DDoS-PSHACK_Flood': 'Attack',
+    'DDoS-SYN_Flood': 'Attack',
+    'DDoS-UDP_Flood': 'Attack',
+    'DDoS-TCP_Flood': 'Attack',
+    'DDoS-ICMP_Flood': 'Attack',
+    'DDoS-SynonymousIP_Flood': 'Attack',
+    'DDoS-ACK_Fragmentation': 'Attack',
+    'DDoS-UDP_Fragmentation': 'Attack',
+    'DDoS-ICMP_Fragmentation': 'Attack',
+    'DDoS-SlowLoris': 'Attack',
+    'DDoS-HTTP_Flood': 'Attack',
+    'DoS-UDP_Flood': 'Attack',
+    'DoS-SYN_Flood': 'Attack',
+    'DoS-TCP_Flood': 'Attack',
+    'DoS-HTTP_Flood': 'Attack',
+    'Mirai-greeth_flood': 'Attack',
+    'Mirai-greip_flood': 'Attack',
+    'Mirai-udpplain': 'Attack',
+    'Recon-PingSweep': 'Attack',
+    'Recon-OSScan': 'Attack',
+    'Recon-PortScan': 'Attack',
+    'VulnerabilityScan': 'Attack',
+    'Recon-HostDiscovery': 'Attack',
+    'DNS_Spoofing': 'Attack',
+    'MITM-ArpSpoofing': 'Attack',
+    'BenignTraffic': 'Benign',
+    'BrowserHijacking': 'Attack',
+    'Backdoor_Malware': 'Attack',
+    'XSS': 'Attack',
+    'Uploading_Attack': 'Attack',
+    'SqlInjection': 'Attack',
+    'CommandInjection': 'Attack',
+    'DictionaryBruteForce': 'Attack',
+}
+
+CACHE_VERSION = 1
+BUNDLE_VERSION = 1
+
+
+def load_datasets(directory, split_ratio=0.8):
+    """Split the sorted CSV shards of `directory` into training and test paths."""
+    datasets = sorted(k for k in os.listdir(directory) if k.endswith('.csv'))
+    paths = [os.path.join(directory, k) for k in datasets]
+    split = int(len(paths) * split_ratio)
+    return paths[:split], paths[split:]
+
+
+def label_codes(y, path=''):
+    codes = pd.Categorical(y, categories=LABELS).codes
+    if (codes < 0).any():
+        raise ValueError(f'{path} contains labels outside LABELS: {sorted(set(np.asarray(y)[codes < 0]))}')
+    return codes.astype(np.int8)
+
+
+def read_csv_shard(path):
+    d = pd.read_csv(path, usecols=X_COLUMNS + [Y_COLUMN])
+    return d[X_COLUMNS].to_numpy(dtype=np.float64), label_codes(d[Y_COLUMN], path)
+
+
+def source_signature(path, hash_contents=False):
+    """Identify a CSV shard by size and mtime, plus a SHA-256 of its bytes if asked."""
+    stat = os.stat(path)
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if hash_contents:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        signature['sha256'] = h.hexdigest()
+    return signature
+
+
+def prepare_shard(path, cache_dir, hash_contents=False):
+    """Convert one CSV shard to float32 features and int8 label codes stored as .npy files.
+
+    The cache is reused as long as the source signature, columns and label
+    set are unchanged. meta.json is written last, so an interrupted
+    conversion is simply redone.
+    """
+    target = os.path.join(cache_dir, os.path.splitext(os.path.basename(path))[0])
+    meta_path = os.path.join(target, 'meta.json')
+    meta = {'version': CACHE_VERSION,
+            'source': os.path.abspath(path),
+            'signature': source_signature(path, hash_contents),
+            'columns': X_COLUMNS,
+            'labels': LABELS}
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                return target
+
+    X, codes = read_csv_shard(path)
+    os.makedirs(target, exist_ok=True)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    np.save(os.path.join(target, 'X.npy'), X.astype(np.float32))
+    np.save(os.path.join(target, 'y.npy'), codes)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    return target
+
+
+def prepare_dataset(paths, cache_dir, n_jobs=None, hash_contents=False):
+    """Make sure every shard has an up-to-date cache and return the cache paths, in order."""
+    os.makedirs(cache_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count()) as pool:
+        futures = [pool.submit(prepare_shard, path, cache_dir, hash_contents) for path in paths]
+        return [future.result() for future in tqdm(futures, desc='Caching')]
+
+
+def load_cached_shard(path):
+    X = np.load(os.path.join(path, 'X.npy'), mmap_mode='r')
+    codes = np.load(os.path.join(path, 'y.npy'), mmap_mode='r')
+    return X, codes
+
+
+def shard_rows(path):
+    """Row count of a shard without parsing it: the cached array's shape, or the CSV's line count."""
+    if os.path.isdir(path):
+        return np.load(os.path.join(path, 'y.npy'), mmap_mode='r').shape[0]
+    lines, last = 0, b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    # The header is not a row; a last line without a newline is.
+    return lines - 1 + (last != b'\n')
+
+
+def read_shard(path):
+    if os.path.isdir(path):
+        return load_cached_shard(path)
+    return read_csv_shard(path)
+
+
+def iter_shards(paths, n_jobs=None, desc=None):
+    """Yield (X, label codes) for each shard in order, parsing up to `n_jobs` shards ahead in worker processes.
+
+    Only `n_jobs` parsed shards are ever held at once, so memory stays bounded
+    while every core is busy parsing.
+    """
+    paths = list(paths)
+    if all(os.path.isdir(path) for path in paths):
+        # Cached shards are memory-mapped, there is nothing to parse.
+        for path in tqdm(paths, desc=desc):
+            yield load_cached_shard(path)
+        return
+
+    n_jobs = n_jobs or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        pending = deque(pool.submit(read_shard, path) for path in paths[:n_jobs])
+        remaining = iter(paths[n_jobs:])
+        for _ in tqdm(range(len(paths)), desc=desc):
+            X, y = pending.popleft().result()
+            path = next(remaining, None)
+            if path is not None:
+                pending.append(pool.submit(read_shard, path))
+            yield X, y
+
+
+def label_lookup(label_mapping=None):
+    """Array turning label codes into target labels, e.g. label_lookup(LABELS_2_CLASSES)[codes]."""
+    if label_mapping is None:
+        return np.asarray(LABELS)
+    return np.asarray([label_mapping[label] for label in LABELS])
+
+
+def fit_scaler(paths, n_jobs=None, reservoir_size=100):
+    """Fit a StandardScaler in one streaming pass over `paths` with partial_fit.
+
+    The same pass keeps the first `reservoir_size` raw rows of every label,
+    which train_forests uses to give each warm-start round the full label set.
+    """
+    scaler = StandardScaler()
+    reservoir_X, reservoir_y, counts = [], [], np.zeros(len(LABELS), dtype=int)
+    for X, y in iter_shards(paths, n_jobs, desc='Scaling'):
+        scaler.partial_fit(X)
+        for code in np.unique(y):
+            need = reservoir_size - counts[code]
+            if need > 0:
+                idx = np.flatnonzero(y == code)[:need]
+                reservoir_X.append(X[idx])
+                reservoir_y.append(y[idx])
+                counts[code] += len(idx)
+    reservoir = (np.concatenate(reservoir_X), np.concatenate(reservoir_y))
+    return scaler, reservoir
+
+
+def train_forests(paths, scaler, reservoir, targets, n_estimators=100, n_jobs=-1, read_jobs=None,
+                  model_cls=RandomForestClassifier):
+    """Grow one forest per target in a single pass over the training shards.
+
+    `targets` maps a model name to a label mapping (None keeps the 34 labels).
+    Consecutive shards are grouped so that every warm_start round grows at
+    least one tree per core (`n_jobs`, as in joblib): a round of one tree
+    would leave all other cores idle. Each group is read and scaled once, its
+    codes are turned into every target's labels with a lookup table, and
+    every forest grows its share of the `n_estimators` trees on it. Only one
+    group is in memory at a time, so fewer cores or more trees mean smaller
+    groups. sklearn re-derives `classes_` on every fit, so reservoir rows of
+    labels missing from a group are appended to keep the class order fixed.
+    """
+    lookups = {name: label_lookup(mapping) for name, mapping in targets.items()}
+    reservoir_codes = reservoir[1]
+
+    rounds = max(1, min(len(paths), n_estimators // effective_n_jobs(n_jobs)))
+    # Last shard of every round, and the trees each round adds; both split as evenly as possible.
+    ends = np.linspace(0, len(paths), rounds + 1).round().astype(int)[1:]
+    trees = np.diff(np.linspace(0, n_estimators, rounds + 1).round().astype(int))
+    models = {name: model_cls(n_estimators=0, warm_start=True, n_jobs=n_jobs) for name in targets}
+    group_X, group_codes, round_ = [], [], 0
+    for i, (X, codes) in enumerate(iter_shards(paths, read_jobs, desc='Training'), 1):
+        group_X.append(X)
+        group_codes.append(codes)
+        if i < ends[round_]:
+            continue
+        X, codes = np.concatenate(group_X), np.concatenate(group_codes)
+        group_X, group_codes = [], []
+        missing = ~np.isin(reservoir_codes, np.unique(codes))
+        if missing.any():
+            X = np.concatenate([X, reservoir[0][missing]])
+            codes = np.concatenate([codes, reservoir_codes[missing]])
+        X = scaler.transform(X)
+        for name, model in models.items():
+            model.set_params(n_estimators=model.n_estimators + int(trees[round_]))
+            model.fit(X, lookups[name][codes])
+        round_ += 1
+    return models
+
+
+def load_training_set(paths, scaler, n_jobs=None):
+    """Parse every training shard in parallel and stack them into one scaled matrix and its label codes.
+
+    The output is allocated once from the shard row counts and filled shard
+    by shard, so peak memory is the training set plus one shard.
+    """
+    paths = list(paths)
+    rows = np.cumsum([0] + [shard_rows(path) for path in paths])
+    X_all = np.empty((rows[-1], len(X_COLUMNS)), dtype=np.float32)
+    codes = np.empty(rows[-1], dtype=np.int8)
+    for i, (X, y) in enumerate(iter_shards(paths, n_jobs, desc='Loading')):
+        if len(y) != rows[i + 1] - rows[i]:
+            raise ValueError(f'{paths[i]} has {len(y)} rows, expected {rows[i + 1] - rows[i]}')
+        X_all[rows[i]:rows[i + 1]] = scaler.transform(X)
+        codes[rows[i]:rows[i + 1]] = y
+    return X_all, codes
+
+
+def evaluate(models, paths, scaler, targets, n_jobs=None):
+    """Score every model in `models` against the test shards in a single pass."""
+    lookups = {name: label_lookup(targets[name]) for name in models}
+    codes, y_pred = [], {name: [] for name in models}
+    for X, y in iter_shards(paths, n_jobs, desc='Testing'):
+        X = scaler.transform(X)
+        codes.append(y)
+        for name, model in models.items():
+            y_pred[name].append(model.predict(X))
+    codes = np.concatenate(codes)
+
+    for name in models:
+        y_test = lookups[name][codes]
+        pred = np.concatenate(y_pred[name])
+        print(f"##### {name} #####")
+        print('accuracy_score: ', accuracy_score(pred, y_test))
+        print('recall_score: ', recall_score(pred, y_test, average='macro'))
+        print('precision_score: ', precision_score(pred, y_test, average='macro'))
+        print('f1_score: ', f1_score(pred, y_test, average='macro'))
+        print()
+        print()
+        print()
+
+
+def export_bundle(model, scaler, file_path, columns=X_COLUMNS):
+    """Dump a model together with the preprocessing it was trained with.
+
+    The bundle is a plain dict so it loads without this module: the feature
+    column order, the fitted scaler's mean_/scale_ and the model itself.
+    Inference applies (X[columns] - mean) / scale and never refits a scaler.
+    Tree models also get a compiled copy with the scaler folded into the
+    thresholds, which the backend evaluates on raw features.
+    """
+    mean = np.asarray(scaler.mean_, dtype=np.float64)
+    scale = np.asarray(scaler.scale_, dtype=np.float64)
+    bundle = {'format_version': BUNDLE_VERSION,
+              'columns': list(columns),
+              'mean': mean,
+              'scale': scale,
+              'classes': list(model.classes_),
+              'model': model}
+    if hasattr(model, 'estimators_') or hasattr(model, 'tree_'):
+        bundle['forest'] = compile_forest(model, mean, scale)
+    dump(bundle, file_path)
+
+
+def export_compact(model, scaler, directory, columns=X_COLUMNS, max_depth=None, min_samples=None):
+    """Write a tree model in the compact serving format and return its engine.
+
+    The forest is compiled with the scaler folded in, optionally pruned to
+    `max_depth` levels or to nodes with at least `min_samples` training
+    samples, stored with float32 thresholds and int16/int32 indices, and
+    written as .npy files the backend memory-maps.
+    """
+    arrays = compact_forest(compile_forest(model, scaler.mean_, scaler.scale_, max_depth, min_samples))
+    save_forest(arrays, directory, columns=list(columns))
+    return ForestEngine(arrays)
+
+
+def directory_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def compare_compact(models, engines, paths, scaler, targets, sizes=None, n_jobs=None):
+    """Report the accuracy of each compact engine next to its full model on the test shards.
+
+    `sizes` optionally maps a model name to its (full, compact) size in bytes.
+    """
+    lookups = {name: label_lookup(targets[name]) for name in models}
+    codes, full, compact = [], {name: [] for name in models}, {name: [] for name in models}
+    for X, y in iter_shards(paths, n_jobs, desc='Comparing'):
+        X = np.asarray(X, dtype=np.float64)
+        X_scaled = scaler.transform(X)
+        codes.append(y)
+        for name, model in models.items():
+            full[name].append(model.predict(X_scaled))
+            compact[name].append(engines[name].predict(X))
+    codes = np.concatenate(codes)
+
+    for name in models:
+        y_test = lookups[name][codes]
+        full_pred, compact_pred = np.concatenate(full[name]), np.concatenate(compact[name])
+        full_accuracy = accuracy_score(y_test, full_pred)
+        compact_accuracy = accuracy_score(y_test, compact_pred)
+        print(f"##### {name} (compact) #####")
+        print('nodes: ', len(engines[name].left), ' depth: ', engines[name].arrays['max_depth'])
+        if sizes and name in sizes:
+            print(f'size: {sizes[name][0] / 1e6:.1f} MB -> {sizes[name][1] / 1e6:.1f} MB')
+        print('accuracy_score: ', compact_accuracy)
+        print('accuracy delta: ', compact_accuracy - full_accuracy)
+        print('agreement with full model: ', np.mean(full_pred == compact_pred))
+        print()